@@ -7,7 +7,7 @@
 
 from krita import (Krita, Extension)
 
-from . import uidocumenttools
+from . import exportwatcher
 
 class SpineExport(Extension):
 
@@ -15,7 +15,9 @@ class SpineExport(Extension):
         super().__init__(parent)
 
     def setup(self):
-        pass
+        # Watch mode outlives the dialog, documents stay watched after it is closed
+        self.watcher = exportwatcher.ExportWatcher()
+        self.uidocumenttools = None
 
     def createActions(self, window):
         action = window.createAction("spineexportAction",i18n("Spine Export"))
@@ -25,7 +27,11 @@ class SpineExport(Extension):
         #action.triggered.connect(self.exportDocument)
 
     def initialize(self):
-        self.uidocumenttools = uidocumenttools.UIDocumentTools()
+        # The dialog and its SpineExport are built once and reused, they keep their settings
+        if self.uidocumenttools is None:
+            # Imported on first use so Krita starts without loading the exporter
+            from . import uidocumenttools
+            self.uidocumenttools = uidocumenttools.UIDocumentTools(self.watcher)
         self.uidocumenttools.initialize()
 
 
@@ -1,35 +1,107 @@
-
+import filecmp
+import json
 import os
-import re
-
-from krita import (Krita, Extension)
-from krita import InfoObject
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 
-import os
-import json
-import re
+from . import atlaspacker
+from . import exportcache
+from . import exportprofiler
+from . import imagetrim
+from . import layerindex
+from . import layernodes
+from . import partialexport
+from . import pngwriter
+from . import scalevariants
+from . import skeletondiff
+from . import spinejson
+from . import spineskel
 
 
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import (QFormLayout, QListWidget, QAbstractItemView,
-                             QDialogButtonBox, QVBoxLayout, QFrame, QTabWidget, QFileDialog,
-                             QPushButton, QAbstractScrollArea, QMessageBox)
+class ExportCancelled(Exception):
+    # Raised by a progress callback to stop the export
+    pass
 
 
 class SpineExport(object):
 
     def __init__(self, parent=None):
         self.msgBox = None
+        # Raise errors instead of showing a message box, used by the batch exporter
+        self.headless = False
         self.fileFormat = 'png'
-        self.bonePattern = re.compile("\(bone\)|\[bone\]", re.IGNORECASE)
-        self.mergePattern = re.compile("\(merge\)|\[merge\]", re.IGNORECASE)
-        self.slotPattern = re.compile("\(slot\)|\[slot\]", re.IGNORECASE)
-        self.skinPattern = re.compile("\(skin\)|\[skin\]", re.IGNORECASE)
+        self.useCache = True
+        # zlib level, pngwriter.PRESETS has the fast, balanced and smallest levels
+        self.compression = 6
+        # One of pngwriter.PIXEL_FORMATS, and whether colors are multiplied by alpha
+        self.pixelFormat = 'rgba8888'
+        self.premultipliedAlpha = False
+        # Ordered dithering of rgba4444 images
+        self.dither = False
+        self.encodeTimes = []
+        # Crop fully transparent borders, pixels with alpha up to trimThreshold count as transparent
+        self.trim = True
+        self.trimThreshold = 0
+        self.workers = os.cpu_count() or 1
+        # Set to an ExportProfiler to record per phase and per layer timings
+        self.profiler = exportprofiler.NullProfiler()
+        self.slowestCount = 5
+        # spine.json layout, jsonIndent None writes compact JSON, jsonPrecision rounds floats
+        self.jsonIndent = 2
+        self.jsonPrecision = None
+        # 'json' writes spine.json, 'skel' the binary spine.skel, 'both' writes both
+        self.outputFormat = 'json'
+        # Write spine.diff.json, the changes since the last export into the same folder
+        self.diffReport = True
+        self.warningCount = 10
+        self.pool = None
+        # Set to an executor to share the encoding threads between exports
+        self.sharedPool = None
+        self.pendingWrites = {}
+        self.pendingBytes = {}
+        # Estimated bytes of pixels the export holds at once: the layer being
+        # read and the images waiting for the encoding threads. Layers bigger
+        # than a quarter of it are read, trimmed and encoded in strips
+        self.memoryBudget = 512 * 1024 * 1024
+        self.heldBytes = 0
+        # Called with (layers read, images written) while exporting, may raise ExportCancelled
+        self.progress = None
+        # Set to an AtlasPacker to pack all images into atlas pages instead of one file each
+        self.atlasPacker = None
+        self.atlasName = 'spine'
+        # Scale factors exported at once, 1 and powers of two below it. A lone
+        # scale of 1 writes into the export directory, otherwise every scale
+        # gets its own folder named like '@0.5x' with its own spine.json
+        self.scales = [1]
+        self.tiers = []
+        # Images with identical pixels are written once, keyed by (width, height, digest)
+        self.imageNames = {}
+        self.writtenNames = set()
+        self.previousImages = {}
+        self.reservedNames = {}
+        self.duplicates = {}
+        self.stats = {}
+        # Layer name tags, parsed names are kept between exports
+        self.nameParser = layerindex.NameParser()
+        self.layerIndex = None
+        # Bone or slot names and layer path globs. When set only their subtrees
+        # are saved and merged into the skeleton already in the export directory
+        self.partial = []
+        self.selection = None
 
     def exportDocument(self, document, directory):
+        # document is a krita.Document or a layernodes.FakeDocument. Returns
+        # False when the export was refused with a message, nothing is written then
         if document is not None:
+            document = layernodes.adaptDocument(document)
+            # spine.json keeps the layout of earlier exports, written next to
+            # spine.skel it follows the Spine 3.8 layout of the binary file
+            header = {"images": directory}
+            if self.outputFormat != 'json':
+                header = {"spine": spineskel.SPINE_VERSION, "images": directory}
             self.json = {
-                "skeleton": {"images": directory},
+                "skeleton": header,
                 "bones": [{"name": "root"}],
                 "slots": [],
                 "skins": {"default": {}},
@@ -38,102 +110,613 @@ class SpineExport(object):
             self.spineBones = self.json['bones']
             self.spineSlots = self.json['slots']
             self.spineSkins = self.json['skins']['default']
+            # Slots of layers outside (slot) groups by (bone, layer name), with
+            # the skins that use them (None is the default skin). A skin layer
+            # shares the slot of the layer it overrides, two layers in the same
+            # skin get their own slots and spine.diff.json warns about the name
+            self.layerSlots = {}
 
-            Krita.instance().setBatchmode(True)
+            if self.atlasPacker and not (document.colorModel() == 'RGBA' and document.colorDepth() == 'U8'):
+                self._alert("Atlas export needs an 8 bit RGBA document")
+                return False
+            if any(scalevariants.halvings(scale) is None for scale in self.scales):
+                self._alert("Scales must be 1, 0.5, 0.25 or smaller powers of two")
+                return False
+            if list(self.scales) != [1] and not (document.colorModel() == 'RGBA' and document.colorDepth() == 'U8'):
+                self._alert("Scale variants need an 8 bit RGBA document")
+                return False
+            if self.partial and self.atlasPacker:
+                self._alert("Partial export can not update atlas pages, export everything instead")
+                return False
+
+            self.tiers = []
+            for scale in sorted(set(self.scales), reverse=True):
+                tier = scalevariants.ScaleTier(scale, self._tierDirectory(directory, scale))
+                os.makedirs(tier.directory, exist_ok=True)
+                if self.useCache and not self.atlasPacker:
+                    tier.cache = exportcache.ExportCache(tier.directory, self._exportSettings(scale))
+                # Atlas images are spooled to disk until packing so memory stays bounded
+                tier.atlasSpool = tempfile.TemporaryFile() if self.atlasPacker else None
+                self.tiers.append(tier)
+            self.selection = None
+            if self.partial:
+                for tier in self.tiers:
+                    tier.previous = partialexport.loadSkeleton(tier.directory)
+                    if tier.previous is None:
+                        self._alert("Partial export needs an earlier export in {0}".format(tier.directory))
+                        return False
+                self.selection = partialexport.LayerSelection(self.partial)
+            self.imageNames = {}
+            self.writtenNames = set()
+            self._reserveImageNames(self.tiers[0].previous if self.selection else None)
+            self.duplicates = {}
+            self.stats = {'layers': 0, 'imagesWritten': 0, 'bytesWritten': 0, 'stripLayers': 0, 'peakBytes': 0}
+            self.encodeTimes = []
+
+            document.setBatchmode(True)
             self.document = document
-            self._export(document.rootNode(), directory)
-            Krita.instance().setBatchmode(False)
-            with open('{0}/{1}'.format(directory, 'spine.json'), 'w') as outfile:
-                json.dump(self.json, outfile, indent=2)
+            # Pixels are read from the document while walking the tree, PNG encoding
+            # and writing happens on the pool (zlib releases the GIL while compressing)
+            self.pool = self.sharedPool or ThreadPoolExecutor(max_workers=self.workers)
+            self.pendingWrites = {}
+            self.pendingBytes = {}
+            self.heldBytes = 0
+            try:
+                start = time.perf_counter()
+                with self.profiler.phase('index'):
+                    self.layerIndex = layerindex.LayerIndex(document.rootNode(), self.nameParser)
+                if self.atlasPacker:
+                    # Layers in other color spaces can only be saved by Krita, as their own files
+                    for record in self.layerIndex.records:
+                        node = record.node
+                        if record.kind == layerindex.IMAGE and not (node.colorModel() == 'RGBA' and node.colorDepth() == 'U8'):
+                            self._alert("Atlas export needs 8 bit RGBA layers, {0} is {1} {2}".format(
+                                record.path, node.colorModel(), node.colorDepth()))
+                            return False
+                with self.profiler.phase('walk'):
+                    self._export(self.layerIndex.root, directory, selected=not self.selection)
+                self.stats['walkSeconds'] = time.perf_counter() - start
+                if self.atlasPacker:
+                    oversized = self._oversizedImage()
+                    if oversized:
+                        self._alert("{0} ({1}x{2}) does not fit on a {3}x{4} atlas page, use larger pages".format(
+                            *oversized + (self.atlasPacker.maxWidth, self.atlasPacker.maxHeight)))
+                        return False
+
+                # Encoding that did not overlap with the walk
+                start = time.perf_counter()
+                with self.profiler.phase('encode'):
+                    if self.atlasPacker:
+                        for tier in self.tiers:
+                            self._writeAtlas(tier)
+                    self._finishWrites()
+                self.stats['encodeSeconds'] = time.perf_counter() - start
+                # Time spent encoding on all workers together
+                self.stats['encodeCpuSeconds'] = sum(self.encodeTimes)
+            except BaseException:
+                # Cancelled or failed, drop the images that did not start encoding yet
+                for future in self.pendingWrites.values():
+                    future.cancel()
+                wait(self.pendingWrites.values())
+                self.pendingWrites = {}
+                self.pendingBytes = {}
+                raise
+            finally:
+                if self.pool is not self.sharedPool:
+                    self.pool.shutdown()
+                self.pool = None
+                document.setBatchmode(False)
+            self._countDuplicates()
+
+            start = time.perf_counter()
+            for tier in self.tiers:
+                skeleton = self.json
+                if tier.directory != directory:
+                    skeleton = scalevariants.scaleSkeleton(self.json, tier.scale, tier.directory)
+                if self.selection:
+                    skeleton = partialexport.mergeSkeleton(tier.previous, skeleton)
+                if self.diffReport:
+                    with self.profiler.phase('diff'):
+                        self._writeDiff(tier, skeleton)
+                if self.outputFormat in ('json', 'both'):
+                    with self.profiler.phase('json'):
+                        self._replaceFile('{0}/{1}'.format(tier.directory, 'spine.json'), lambda fileName: self._writeJson(fileName, skeleton))
+                if self.outputFormat in ('skel', 'both'):
+                    with self.profiler.phase('skel'):
+                        self._replaceFile('{0}/{1}'.format(tier.directory, 'spine.skel'), lambda fileName: spineskel.writeSkeleton(fileName, skeleton))
+            self.stats['jsonSeconds'] = time.perf_counter() - start
+
+            for tier in self.tiers:
+                if tier.cache:
+                    # Images of layers that were deleted or renamed since the last export,
+                    # a partial export did not visit the other layers and keeps them
+                    with self.profiler.phase('cache'):
+                        if not self.selection:
+                            tier.cache.removeStale()
+                        tier.cache.save(keepPrevious=bool(self.selection))
+            return True
         else:
             self._alert("Please select a Document")
+            return False
 
     @staticmethod
     def quote(value):
         return '"' + value + '"'
 
-    def _alert(self, message):
-        self.msgBox = self.msgBox if self.msgBox else QMessageBox()
-        self.msgBox.setText(message)
-        self.msgBox.exec_()
+    def summary(self):
+        lines = []
+        if self.stats.get('duplicateFiles'):
+            lines.append("{0} duplicate images shared, {1} bytes saved".format(
+                self.stats['duplicateFiles'], self.stats['duplicateBytes']))
+
+        if self.stats.get('imagesWritten'):
+            presets = dict((level, name) for name, level in pngwriter.PRESETS.items())
+            lines.append("{0} images encoded ({1}, {2}{3}{4}) in {5:.2f}s, {6} bytes".format(
+                self.stats['imagesWritten'], presets.get(self.compression, 'level {0}'.format(self.compression)),
+                self.pixelFormat, ', dithered' if self.dither and self.pixelFormat == 'rgba4444' else '',
+                ', premultiplied' if self.premultipliedAlpha else '',
+                self.stats.get('encodeCpuSeconds', 0.0), self.stats['bytesWritten']))
+
+        if self.stats.get('peakBytes'):
+            lines.append("Peak pixel memory {0:.1f} MB of {1:.0f} MB budget, {2} layers read in strips".format(
+                self.stats['peakBytes'] / 1048576.0, self.memoryBudget / 1048576.0, self.stats['stripLayers']))
+
+        if 'changes' in self.stats:
+            lines.append("Changes: " + ", ".join(
+                "{0} +{1} -{2} moved {3}".format(kind, *self.stats['changes'][kind])
+                for kind in ('bones', 'slots', 'attachments')))
+        warnings = self.stats.get('warnings', [])
+        for warning in warnings[:self.warningCount]:
+            lines.append("Warning: " + warning)
+        if len(warnings) > self.warningCount:
+            lines.append("... {0} more warnings in spine.diff.json".format(len(warnings) - self.warningCount))
+
+        slowest = self.profiler.slowestLayers(self.slowestCount)
+        if slowest:
+            lines.append("Slowest layers:")
+            for layer, seconds, written in slowest:
+                lines.append("  {0}: {1:.3f}s, {2} bytes".format(layer, seconds, written))
+        return lines
 
-    def _export(self, node, directory, bone="root", xOffset=0, yOffset=0, slot=None):
-        for child in node.childNodes():
-            if "selectionmask" in child.type():
+    def _writeDiff(self, tier, skeleton):
+        # Compares with the skeleton still on disk, before it is replaced
+        previous = tier.previous if self.selection else partialexport.loadSkeleton(tier.directory)
+        # Floats read back from a rounded spine.json differ by up to half a digit
+        tolerance = 10 ** -self.jsonPrecision if self.jsonPrecision is not None else 1e-6
+        report = skeletondiff.diffSkeletons(previous, skeleton, tolerance)
+        with open('{0}/{1}'.format(tier.directory, 'spine.diff.json'), 'w') as outfile:
+            json.dump(report, outfile, indent=2)
+        if tier is self.tiers[0]:
+            self.stats['changes'] = skeletondiff.counts(report)
+            self.stats['warnings'] = [warning['message'] for warning in report['warnings']]
+
+    def _writeJson(self, fileName, skeleton):
+        with open(fileName, 'w') as outfile:
+            if self.outputFormat == 'both':
+                skeleton = spinejson.toSpine38(skeleton)
+            spinejson.SpineJsonWriter(outfile, self.jsonIndent, self.jsonPrecision).write(skeleton)
+
+    def _replaceFile(self, fileName, write):
+        # Writes next to fileName and swaps it in, a Spine editor watching the
+        # folder never sees a partial file and no reload is triggered when
+        # nothing changed
+        temporaryFileName = fileName + '.tmp'
+        write(temporaryFileName)
+        if os.path.exists(fileName) and filecmp.cmp(temporaryFileName, fileName, shallow=False):
+            os.remove(temporaryFileName)
+        else:
+            os.replace(temporaryFileName, fileName)
+
+    def _tierDirectory(self, directory, scale):
+        if list(self.scales) == [1]:
+            return directory
+        return '{0}/{1}'.format(directory, scalevariants.tierName(scale))
+
+    def _exportSettings(self, scale=1):
+        return {
+            'scale': scale,
+            'fileFormat': self.fileFormat,
+            'resolution': [96, 96],
+            'compression': self.compression,
+            'pixelFormat': self.pixelFormat,
+            'premultipliedAlpha': self.premultipliedAlpha,
+            'dither': self.dither,
+            'trim': self.trim,
+            'trimThreshold': self.trimThreshold,
+        }
+
+    def _saveLayer(self, node, directory, name, rect, previous=None):
+        # Returns the rect of the written image, which is smaller than the
+        # node bounds when transparent borders were trimmed, and the image the
+        # attachment should point to when it is not named like the layer.
+        # previous is the image the attachment used before a partial export
+        self.stats['layers'] += 1
+        if self._canEncode(node, rect) and rect.width() * rect.height() * 4 > self.memoryBudget // 4:
+            return self._saveStrips(node, name, rect, previous)
+        pixelData = self._pixelData(node, rect)
+        self._hold(len(pixelData))
+        try:
+            return self._savePixels(node, name, rect, pixelData, previous)
+        finally:
+            self._release(len(pixelData))
+
+    def _savePixels(self, node, name, rect, pixelData, previous=None):
+        if self.trim and self._canEncode(node, rect):
+            trimmed = imagetrim.trimBounds(pixelData, rect.width(), rect.height(), self.trimThreshold)
+            if trimmed and trimmed != (0, 0, rect.width(), rect.height()):
+                pixelData = imagetrim.crop(pixelData, rect.width(), *trimmed)
+                rect = layernodes.Rect(rect.x() + trimmed[0], rect.y() + trimmed[1], trimmed[2], trimmed[3])
+
+        digest = exportcache.ExportCache.digest(pixelData)
+        imageName, written = self._imageName(name, rect, digest, previous)
+        path = imageName if imageName != name else None
+        if written:
+            return rect, path
+        fileName = '{0}.{1}'.format(imageName, self.fileFormat)
+
+        # The pixels of every scale tier come from this one read
+        scales = [tier.scale for tier in self.tiers]
+        if self._canEncode(node, rect):
+            images = scalevariants.variants(pixelData, rect.width(), rect.height(), scales)
+        else:
+            images = [(scale, None, rect.width(), rect.height()) for scale in scales]
+
+        bounds = (rect.x(), rect.y(), rect.width(), rect.height())
+        for tier, (scale, data, width, height) in zip(self.tiers, images):
+            if tier.atlasSpool:
+                if not rect.isEmpty():
+                    tier.atlasImages[imageName] = (width, height, tier.atlasSpool.tell())
+                    tier.atlasSpool.write(data)
                 continue
 
-            if not child.visible():
+            if tier.cache and tier.cache.isCurrent(fileName, digest, bounds):
                 continue
 
-            if '[ignore]' in child.name():
+            layerFileName = '{0}/{1}'.format(tier.directory, fileName)
+            if '/' in fileName:
+                os.makedirs(os.path.dirname(layerFileName), exist_ok=True)
+
+            if data is not None:
+                self._submitWrite(layerFileName, data, width, height, name, name)
+            else:
+                # Fall back to Krita for color spaces the pool can not encode
+                self.profiler.call('save ' + name, 'encode', name, node.save, layerFileName)
+                self.stats['imagesWritten'] += 1
+                self.stats['bytesWritten'] += os.path.getsize(layerFileName)
+        return rect, path
+
+    def _saveStrips(self, node, name, rect, previous=None):
+        # _savePixels for layers too big to hold at once. The layer is read in
+        # strips three times: to find the trimmed bounds, to hash the pixels
+        # (and add the colors of indexed images to their palettes) and to encode every tier
+        self.stats['stripLayers'] += 1
+        if self.trim:
+            trimmed = imagetrim.trimStrips(self._strips(node, rect), rect.width(), self.trimThreshold)
+            if trimmed:
+                rect = layernodes.Rect(rect.x() + trimmed[0], rect.y() + trimmed[1], trimmed[2], trimmed[3])
+
+        scales = [tier.scale for tier in self.tiers]
+        hasher = exportcache.ExportCache.hasher()
+        palettes = [pngwriter.Palette() if self.pixelFormat == 'indexed' else None for tier in self.tiers]
+        for data, height in self._strips(node, rect):
+            hasher.update(data)
+            if self.pixelFormat != 'indexed':
                 continue
+            for palette, (scale, scaled, width, scaledHeight) in zip(
+                    palettes, scalevariants.variants(data, rect.width(), height, scales)):
+                palette.add(pngwriter.convert(scaled, width, scaledHeight, self.pixelFormat, self.premultipliedAlpha))
+        digest = hasher.hexdigest()
+        imageName, written = self._imageName(name, rect, digest, previous)
+        path = imageName if imageName != name else None
+        if written:
+            return rect, path
+        fileName = '{0}.{1}'.format(imageName, self.fileFormat)
 
-            if child.childNodes():
-                if not self.mergePattern.search(child.name()):
-                    newBone = bone
-                    newSlot = slot
-                    newX = xOffset
-                    newY = yOffset
-
-                    # Found a bone
-                    if self.bonePattern.search(child.name()):
-                        newBone = self.bonePattern.sub('', child.name()).strip()
-                        rect = child.bounds()
-                        newX = rect.left() + rect.width() / 2 - xOffset
-                        newY = (- rect.bottom() + rect.height() / 2) - yOffset
+        bounds = (rect.x(), rect.y(), rect.width(), rect.height())
+        writers = []
+        streams = []
+        for tier, palette in zip(self.tiers, palettes):
+            width = scalevariants.scaledSize(rect.width(), tier.scale)
+            height = scalevariants.scaledSize(rect.height(), tier.scale)
+            if tier.atlasSpool:
+                tier.atlasImages[imageName] = (width, height, tier.atlasSpool.tell())
+                writers.append(lambda data, rows, spool=tier.atlasSpool: spool.write(data))
+                continue
+            if tier.cache and tier.cache.isCurrent(fileName, digest, bounds):
+                writers.append(None)
+                continue
+
+            layerFileName = '{0}/{1}'.format(tier.directory, fileName)
+            if '/' in fileName:
+                os.makedirs(os.path.dirname(layerFileName), exist_ok=True)
+            if palette is not None:
+                palette.finish()
+            stream = pngwriter.PngStream(layerFileName, width, height, self.compression, self.pixelFormat,
+                                         self.premultipliedAlpha, palette, self.dither)
+            streams.append(stream)
+            writers.append(stream.write)
+
+        if any(writers):
+            self.profiler.call('encode ' + name, 'encode', name, self._encodeStrips, node, rect, writers, streams)
+        return rect, path
+
+    def _encodeStrips(self, node, rect, writers, streams):
+        # Runs on the export thread, nodes can not be read from the pool.
+        # Returns the number of bytes written
+        start = time.perf_counter()
+        scales = [tier.scale for tier in self.tiers]
+        try:
+            for data, height in self._strips(node, rect):
+                for write, (scale, scaled, width, scaledHeight) in zip(
+                        writers, scalevariants.variants(data, rect.width(), height, scales)):
+                    if write:
+                        write(scaled, scaledHeight)
+        except BaseException:
+            for stream in streams:
+                stream.discard()
+            raise
+        written = sum(stream.close() for stream in streams)
+        self.encodeTimes.append(time.perf_counter() - start)
+        self.stats['imagesWritten'] += len(streams)
+        self.stats['bytesWritten'] += written
+        return written
+
+    def _strips(self, node, rect):
+        # Yields (pixels, rows) of rect in strips of about an eighth of the
+        # memory budget. Strip heights are a multiple of the largest halving,
+        # so halving a strip gives the rows halving the whole image gives
+        step = 2 ** max(scalevariants.halvings(tier.scale) for tier in self.tiers)
+        rows = max(step, self.memoryBudget // 8 // (rect.width() * 4) // step * step)
+        for y in range(rect.y(), rect.y() + rect.height(), rows):
+            height = min(rows, rect.y() + rect.height() - y)
+            data = self._pixelData(node, layernodes.Rect(rect.x(), y, rect.width(), height))
+            self._hold(len(data))
+            try:
+                yield data, height
+            finally:
+                self._release(len(data))
+
+    def _pixelData(self, node, rect):
+        # The layer opacity is applied before trimming, hashing and encoding.
+        # Other color spaces are saved by Node.save, which applies it itself
+        pixelData = node.pixelData(rect)
+        if node.colorModel() == 'RGBA' and node.colorDepth() == 'U8':
+            pixelData = layernodes.applyOpacity(pixelData, node.opacity())
+        return pixelData
+
+    def _imageName(self, name, rect, digest, previous=None):
+        # (image name, True when an earlier layer with identical pixels already
+        # wrote it). Every image name is written once: a layer whose name was
+        # taken by different pixels gets a numbered name, e.g. 'eye_2'. Names
+        # are compared ignoring case, like Windows and macOS file names.
+        # A partial export keeps the previous image of a layer unless another
+        # attachment uses it too, and never takes the reserved names
+        imageKey = (rect.width(), rect.height(), digest)
+        imageName = self.imageNames.get(imageKey)
+        if imageName is not None:
+            self.duplicates[imageName] = self.duplicates.get(imageName, 0) + 1
+            return imageName, True
+
+        reusable = previous is not None and self.reservedNames.get(previous.lower()) == 1
+        if reusable and previous.lower() not in self.writtenNames:
+            imageName = previous
+        else:
+            imageName = name
+            number = 2
+            while imageName.lower() in self.writtenNames or imageName.lower() in self.reservedNames:
+                imageName = '{0}_{1}'.format(name, number)
+                number += 1
+        self.imageNames[imageKey] = imageName
+        self.writtenNames.add(imageName.lower())
+        return imageName, False
+
+    def _reserveImageNames(self, skeleton):
+        # The images the attachments of the previous skeleton use, by
+        # (skin, slot, attachment), and how many attachments use each name
+        self.previousImages = {}
+        self.reservedNames = {}
+        if skeleton is None:
+            return
+        for skinName, skin in skeleton.get('skins', {}).items():
+            for slotName, attachments in skin.items():
+                for attachmentName, attachment in attachments.items():
+                    image = attachment.get('path') or attachmentName
+                    self.previousImages[(skinName, slotName, attachmentName)] = image
+                    self.reservedNames[image.lower()] = self.reservedNames.get(image.lower(), 0) + 1
+
+    def _submitWrite(self, fileName, data, width, height, label, layer=None):
+        # Images waiting for the pool may use half of the memory budget
+        while self.pendingWrites and sum(self.pendingBytes.values()) + len(data) > self.memoryBudget // 2:
+            self._waitForWrite(next(iter(self.pendingWrites)))
+        self.pendingBytes[fileName] = len(data)
+        self._hold(len(data))
+        self.pendingWrites[fileName] = self.pool.submit(
+            self.profiler.call, 'encode ' + label, 'encode', layer,
+            self._writePng, fileName, data, width, height)
+
+    def _hold(self, size):
+        self.heldBytes += size
+        self.stats['peakBytes'] = max(self.stats['peakBytes'], self.heldBytes)
+
+    def _release(self, size):
+        self.heldBytes -= size
+
+    def _countDuplicates(self):
+        duplicateBytes = 0
+        for tier in self.tiers:
+            for name, count in self.duplicates.items():
+                if self.atlasPacker:
+                    # Atlas pages are counted in uncompressed pixels
+                    width, height, offset = tier.atlasImages.get(name, (0, 0, 0))
+                    size = width * height * 4
+                else:
+                    size = os.path.getsize('{0}/{1}.{2}'.format(tier.directory, name, self.fileFormat))
+                duplicateBytes += size * count
+        self.stats['duplicateFiles'] = sum(self.duplicates.values())
+        self.stats['duplicateBytes'] = duplicateBytes
+
+    def _oversizedImage(self):
+        # (name, width, height) of the first image too large for an atlas page
+        for tier in self.tiers:
+            for name, (width, height, offset) in sorted(tier.atlasImages.items()):
+                if not self.atlasPacker.fits(width, height):
+                    return name, width, height
+        return None
+
+    def _writeAtlas(self, tier):
+        images = [(name, width, height) for name, (width, height, offset) in tier.atlasImages.items()]
+        pages = self.atlasPacker.pack(images)
+        pageFileNames = [
+            '{0}.{1}'.format(self.atlasName if index == 0 else '{0}_{1}'.format(self.atlasName, index + 1), self.fileFormat)
+            for index in range(len(pages))
+        ]
+
+        for page, pageFileName in zip(pages, pageFileNames):
+            pageData = bytearray(page.width * page.height * 4)
+            for region in page.regions:
+                width, height, offset = tier.atlasImages[region.name]
+                tier.atlasSpool.seek(offset)
+                atlaspacker.blit(pageData, page.width, tier.atlasSpool.read(width * height * 4),
+                                 width, height, region.x, region.y, region.rotated)
+
+            # Only keep as many pages in memory as there are workers encoding them
+            if len(self.pendingWrites) >= self.workers:
+                self._waitForWrite(next(iter(self.pendingWrites)))
+            pagePath = '{0}/{1}'.format(tier.directory, pageFileName)
+            self._submitWrite(pagePath, pageData, page.width, page.height, pageFileName)
+
+        tier.atlasSpool.close()
+        tier.atlasSpool = None
+        atlaspacker.writeAtlas('{0}/{1}.atlas'.format(tier.directory, self.atlasName), pages, pageFileNames,
+                               'RGBA4444' if self.pixelFormat == 'rgba4444' else 'RGBA8888')
+
+    def _writePng(self, fileName, data, width, height):
+        # Runs on the pool, returns the number of bytes written
+        start = time.perf_counter()
+        written = pngwriter.writePng(fileName, data, width, height, self.compression,
+                                     self.pixelFormat, self.premultipliedAlpha, self.dither)
+        self.encodeTimes.append(time.perf_counter() - start)
+        return written
+
+    def _canEncode(self, node, rect):
+        return node.colorModel() == 'RGBA' and node.colorDepth() == 'U8' and not rect.isEmpty()
+
+    def _finishWrites(self):
+        while self.pendingWrites:
+            self._waitForWrite(next(iter(self.pendingWrites)))
+            self._reportProgress()
+
+    def _reportProgress(self):
+        if self.progress:
+            self.progress(self.stats['layers'], self.stats['imagesWritten'])
+
+    def _waitForWrite(self, fileName):
+        # Re-raises errors from the pool
+        self.stats['bytesWritten'] += self.pendingWrites.pop(fileName).result()
+        self._release(self.pendingBytes.pop(fileName))
+        self.stats['imagesWritten'] += 1
+
+    def _alert(self, message):
+        if self.headless:
+            raise RuntimeError(message)
+        from PyQt5.QtWidgets import QMessageBox
+        self.msgBox = self.msgBox if self.msgBox else QMessageBox()
+        self.msgBox.setText(message)
+        self.msgBox.exec_()
+
+    def _export(self, record, directory, bone="root", xOffset=0, yOffset=0, slot=None, skin=None, selected=True):
+        # record is a layerindex.LayerRecord, hidden and ignored layers are not in the index.
+        # Groups outside the selection of a partial export are walked for the
+        # bone offsets only, their bones, slots and layers are left out
+        for child in record.children:
+            tags = child.tags
+            childSelected = selected or self.selection.matches(child)
+            if child.kind == layerindex.GROUP:
+                newBone = bone
+                newSlot = slot
+                newX = xOffset
+                newY = yOffset
+
+                # Found a bone
+                if tags.bone is not None:
+                    newBone = tags.bone
+                    rect = child.bounds
+                    newX = rect.left() + rect.width() / 2 - xOffset
+                    newY = (- rect.bottom() + rect.height() / 2) - yOffset
+                    if childSelected:
                         self.spineBones.append({
                             'name': newBone,
                             'parent': bone,
                             'x': newX,
                             'y': newY
                         })
-                        newX = xOffset + newX
-                        newY = yOffset + newY
-
-                    # Found a slot
-                    if self.slotPattern.search(child.name()):
-                        newSlotName = self.slotPattern.sub('', child.name()).strip()
-                        newSlot = {
-                            'name': newSlotName,
-                            'bone': bone,
-                            'attachment': None,
-                        }
+                    newX = xOffset + newX
+                    newY = yOffset + newY
+
+                # Found a slot
+                if tags.slot is not None:
+                    newSlot = {
+                        'name': tags.slot,
+                        'bone': bone,
+                        'attachment': None,
+                    }
+                    if childSelected:
                         self.spineSlots.append(newSlot)
 
-                    ## Found a skin
-                    if self.skinPattern.search(child.name()):
-                        new_skin_name = self.skinPattern.sub('', child.name()).strip()
-                        new_skin = "" #  "#'\t{ "name": ' + self.quote(new_skin_name) + ', "bone": '# + self.quote(slot.bone ? slot.bone.name : "root");
-                        self.spineDefaultSkins.append(new_skin)
+                # Found a skin
+                newSkin = skin
+                if tags.skin is not None:
+                    newSkin = tags.skin
+                    self.json['skins'].setdefault(newSkin, {})
 
-                    self._export(child, directory, newBone, newX, newY, newSlot)
-                    continue
+                self._export(child, directory, newBone, newX, newY, newSlot, newSkin, childSelected)
+                continue
+            if not childSelected:
+                continue
 
-            name = self.mergePattern.sub('', child.name()).strip()
-            layer_file_name = '{0}/{1}.{2}'.format(directory, name, self.fileFormat)
-            child.save(layer_file_name, 96, 96, InfoObject())
+            name = tags.imageName
+            # Images of a skin are saved in a folder named after it, identical
+            # images are saved once and shared between the skins
+            imageName = name if skin is None else '{0}/{1}'.format(skin, name)
+            previous = self.previousImages.get((skin or 'default', slot['name'] if slot else name, name))
+            with self.profiler.phase(imageName, 'layer', imageName):
+                rect, path = self._saveLayer(child.node, directory, imageName, child.bounds, previous)
+            self._reportProgress()
+            if self.atlasPacker and rect.isEmpty():
+                # Empty layers have no atlas region, an attachment would not find one
+                continue
+            if skin is not None and path is None:
+                path = imageName
 
             newSlot = slot
 
             if not newSlot:
-                newSlot = {
-                    'name': name,
-                    'bone': bone,
-                    'attachment': name,
-                }
-                self.spineSlots.append(newSlot)
+                # The attachment name is the placeholder every skin fills in
+                newSlot, skins = self.layerSlots.get((bone, name), (None, None))
+                if not newSlot or skin in skins:
+                    newSlot = {
+                        'name': name,
+                        'bone': bone,
+                        'attachment': name,
+                    }
+                    skins = set()
+                    self.layerSlots[(bone, name)] = (newSlot, skins)
+                    self.spineSlots.append(newSlot)
+                skins.add(skin)
             else:
                 if not newSlot['attachment']:
                     newSlot['attachment'] = name
 
-            rect = child.bounds()
             slotName = newSlot['name']
-            if slotName not in self.spineSkins:
-                self.spineSkins[slotName] = {}
-            self.spineSkins[slotName][name] = {
+            skinAttachments = self.spineSkins if skin is None else self.json['skins'][skin]
+            if slotName not in skinAttachments:
+                skinAttachments[slotName] = {}
+            skinAttachments[slotName][name] = {
                 'x': rect.left() + rect.width() / 2 - xOffset,
                 'y': (- rect.bottom() + rect.height() / 2) - yOffset,
                 'rotation': 0,
                 'width': rect.width(),
                 'height': rect.height(),
             }
+            if path:
+                skinAttachments[slotName][name]['path'] = path
@@ -1 +1,7 @@
-from .KritaToSpine import *  # noqa: F401, F403
+try:
+    import krita  # noqa: F401
+except ImportError:
+    # Imported outside of Krita, e.g. by the command line batch exporter
+    pass
+else:
+    from .KritaToSpine import *  # noqa: F401, F403
@@ -0,0 +1,193 @@
+from array import array
+
+
+class AtlasRegion(object):
+
+    def __init__(self, name, x, y, width, height, rotated):
+        self.name = name
+        self.x = x
+        self.y = y
+        # Size of the image before rotation, as written into the .atlas file
+        self.width = width
+        self.height = height
+        self.rotated = rotated
+
+
+class AtlasPage(object):
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.regions = []
+        self.freeRects = [(0, 0, width, height)]
+
+
+class AtlasPacker(object):
+    # MaxRects bin packer (best short side fit), see Jukka Jylanki,
+    # "A Thousand Ways to Pack the Bin"
+
+    def __init__(self, maxWidth=2048, maxHeight=2048, padding=2, powerOfTwo=True, allowRotation=False):
+        self.maxWidth = maxWidth
+        self.maxHeight = maxHeight
+        self.padding = padding
+        self.powerOfTwo = powerOfTwo
+        self.allowRotation = allowRotation
+
+    def pack(self, images):
+        # images is a list of (name, width, height), returns a list of AtlasPage
+        pages = []
+        order = sorted(images, key=lambda image: (max(image[1], image[2]), image[1] * image[2]), reverse=True)
+
+        for name, width, height in order:
+            # Each image reserves its padding on the right and bottom, the page
+            # reserves it once on the top and left
+            paddedWidth = width + self.padding
+            paddedHeight = height + self.padding
+            if not self.fits(width, height):
+                raise ValueError("{0} ({1}x{2}) does not fit on a {3}x{4} atlas page".format(
+                    name, width, height, self.maxWidth, self.maxHeight))
+
+            placement = None
+            for page in pages:
+                placement = self._findPosition(page, paddedWidth, paddedHeight)
+                if placement:
+                    break
+            else:
+                page = AtlasPage(self.maxWidth - self.padding, self.maxHeight - self.padding)
+                pages.append(page)
+                placement = self._findPosition(page, paddedWidth, paddedHeight)
+
+            x, y, placedWidth, placedHeight, rotated = placement
+            self._place(page, (x, y, placedWidth, placedHeight))
+            page.regions.append(AtlasRegion(name, x + self.padding, y + self.padding, width, height, rotated))
+
+        for page in pages:
+            self._shrink(page)
+            page.freeRects = None
+        return pages
+
+    def fits(self, width, height):
+        # Whether an image of this size fits on an empty page, with its padding
+        limitWidth = self.maxWidth - 2 * self.padding
+        limitHeight = self.maxHeight - 2 * self.padding
+        if width <= limitWidth and height <= limitHeight:
+            return True
+        return self.allowRotation and height <= limitWidth and width <= limitHeight
+
+    def _findPosition(self, page, width, height):
+        best = None
+        bestScore = None
+        candidates = [(width, height, False)]
+        if self.allowRotation and width != height:
+            candidates.append((height, width, True))
+
+        for freeX, freeY, freeWidth, freeHeight in page.freeRects:
+            for candidateWidth, candidateHeight, rotated in candidates:
+                if candidateWidth > freeWidth or candidateHeight > freeHeight:
+                    continue
+                leftoverX = freeWidth - candidateWidth
+                leftoverY = freeHeight - candidateHeight
+                score = (min(leftoverX, leftoverY), max(leftoverX, leftoverY))
+                if bestScore is None or score < bestScore:
+                    bestScore = score
+                    best = (freeX, freeY, candidateWidth, candidateHeight, rotated)
+        return best
+
+    def _place(self, page, used):
+        usedX, usedY, usedWidth, usedHeight = used
+        freeRects = []
+
+        for free in page.freeRects:
+            freeX, freeY, freeWidth, freeHeight = free
+            apartX = usedX >= freeX + freeWidth or usedX + usedWidth <= freeX
+            apartY = usedY >= freeY + freeHeight or usedY + usedHeight <= freeY
+            if apartX or apartY:
+                freeRects.append(free)
+                continue
+
+            # Split the free rectangle around the used one
+            if usedX > freeX:
+                freeRects.append((freeX, freeY, usedX - freeX, freeHeight))
+            if usedX + usedWidth < freeX + freeWidth:
+                freeRects.append((usedX + usedWidth, freeY, freeX + freeWidth - usedX - usedWidth, freeHeight))
+            if usedY > freeY:
+                freeRects.append((freeX, freeY, freeWidth, usedY - freeY))
+            if usedY + usedHeight < freeY + freeHeight:
+                freeRects.append((freeX, usedY + usedHeight, freeWidth, freeY + freeHeight - usedY - usedHeight))
+
+        page.freeRects = self._prune(freeRects)
+
+    @staticmethod
+    def _prune(freeRects):
+        # Drop free rectangles contained in another one
+        pruned = []
+        freeRects.sort(key=lambda rect: rect[2] * rect[3], reverse=True)
+        for rect in freeRects:
+            x, y, width, height = rect
+            for otherX, otherY, otherWidth, otherHeight in pruned:
+                inside = x >= otherX and y >= otherY and x + width <= otherX + otherWidth
+                if inside and y + height <= otherY + otherHeight:
+                    break
+            else:
+                pruned.append(rect)
+        return pruned
+
+    def _shrink(self, page):
+        width = 0
+        height = 0
+        for region in page.regions:
+            regionWidth, regionHeight = (region.height, region.width) if region.rotated else (region.width, region.height)
+            width = max(width, region.x + regionWidth + self.padding)
+            height = max(height, region.y + regionHeight + self.padding)
+
+        if self.powerOfTwo:
+            width = min(self._nextPowerOfTwo(width), self.maxWidth)
+            height = min(self._nextPowerOfTwo(height), self.maxHeight)
+        page.width = width
+        page.height = height
+
+    @staticmethod
+    def _nextPowerOfTwo(value):
+        power = 1
+        while power < value:
+            power *= 2
+        return power
+
+
+def blit(page, pageWidth, data, width, height, x, y, rotated):
+    # Copies 4 bytes per pixel image data into a page buffer, rotated images
+    # are stored 90 degrees counter clockwise like the Spine texture packer does
+    stride = width * 4
+    if not rotated:
+        for row in range(height):
+            offset = ((y + row) * pageWidth + x) * 4
+            page[offset:offset + stride] = data[row * stride:(row + 1) * stride]
+        return
+
+    pixels = array('I')
+    pixels.frombytes(data)
+    for row in range(width):
+        offset = ((y + row) * pageWidth + x) * 4
+        page[offset:offset + height * 4] = pixels[width - 1 - row::width].tobytes()
+
+
+def writeAtlas(fileName, pages, pageFileNames, pixelFormat='RGBA8888'):
+    lines = []
+    for page, pageFileName in zip(pages, pageFileNames):
+        lines.append('')
+        lines.append(pageFileName)
+        lines.append('size: {0},{1}'.format(page.width, page.height))
+        lines.append('format: {0}'.format(pixelFormat))
+        lines.append('filter: Linear,Linear')
+        lines.append('repeat: none')
+        for region in page.regions:
+            lines.append(region.name)
+            lines.append('  rotate: {0}'.format('true' if region.rotated else 'false'))
+            lines.append('  xy: {0}, {1}'.format(region.x, region.y))
+            lines.append('  size: {0}, {1}'.format(region.width, region.height))
+            lines.append('  orig: {0}, {1}'.format(region.width, region.height))
+            lines.append('  offset: 0, 0')
+            lines.append('  index: -1')
+
+    with open(fileName, 'w') as outfile:
+        outfile.write('\n'.join(lines) + '\n')
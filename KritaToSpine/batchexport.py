@@ -0,0 +1,205 @@
+# Command line batch exporter
+# Runs the Spine export on many documents without opening the dialog, each
+# document is exported by its own kritarunner process:
+#
+#   python -m KritaToSpine.batchexport --output build/spine art/*.kra
+#
+# Every document is written into a folder named after it inside the output
+# directory. The exit code is non-zero when any document failed.
+
+import argparse
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='KritaToSpine.batchexport', description='Export Krita documents to Spine.')
+    parser.add_argument('documents', nargs='+', help='Documents or glob patterns to export')
+    parser.add_argument('-o', '--output', required=True, help='Output root, one folder is created per document')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1, help='Number of documents exported at once')
+    parser.add_argument('--workers', type=int, default=0, help='Encoding threads per document, defaults to the CPU count divided by jobs')
+    parser.add_argument('--memory-budget', type=int, default=512, metavar='MB',
+                        help='Pixels held at once per document, larger layers are read and encoded in strips')
+    parser.add_argument('--krita', default='kritarunner', help='kritarunner executable')
+    parser.add_argument('--atlas', action='store_true', help='Pack images into a texture atlas')
+    parser.add_argument('--atlas-size', type=int, default=2048, metavar='PIXELS',
+                        help='Width and height of the largest atlas page, every layer must fit on one page')
+    parser.add_argument('--no-trim', action='store_true', help='Keep transparent borders')
+    parser.add_argument('--no-cache', action='store_true', help='Save every layer even if it did not change')
+    parser.add_argument('--scales', type=parseScales, default=[1], help='Comma separated scale factors, e.g. 1,0.5,0.25, each written into its own @0.5x style folder')
+    parser.add_argument('--format', choices=('json', 'skel', 'both'), default='json', help='Write spine.json, spine.skel or both')
+    parser.add_argument('--preset', choices=('fast', 'balanced', 'smallest'), default='balanced', help='PNG compression preset')
+    parser.add_argument('--pixel-format', choices=('rgba8888', 'rgba4444', 'indexed'), default='rgba8888',
+                        help='Keep the pixels, round channels to 4 bits or write palette PNGs of at most 256 colors')
+    parser.add_argument('--premultiplied', action='store_true', help='Premultiply colors by alpha')
+    parser.add_argument('--dither', action='store_true', help='Dither rgba4444 images')
+    parser.add_argument('--compact', action='store_true', help='Write spine.json without indentation')
+    parser.add_argument('--precision', type=int, default=None, help='Round floats in spine.json to this many decimals')
+    parser.add_argument('--only', action='append', default=[], metavar='NAME',
+                        help='Only export this bone, slot or layer path glob and merge it into the existing spine.json, can be repeated')
+    parser.add_argument('--no-diff', action='store_true', help='Do not write spine.diff.json')
+    parser.add_argument('--profile', action='store_true', help='Write spine.trace.json and list the slowest layers')
+    args = parser.parse_args(argv)
+
+    documents = expandDocuments(args.documents)
+    if not documents:
+        print('No documents found', file=sys.stderr)
+        return 2
+
+    jobs = max(1, min(args.jobs, len(documents)))
+    options = {
+        'atlas': args.atlas,
+        'atlasSize': args.atlas_size,
+        'trim': not args.no_trim,
+        'cache': not args.no_cache,
+        'workers': args.workers or max(1, (os.cpu_count() or 1) // jobs),
+        'profile': args.profile,
+        'compact': args.compact,
+        'format': args.format,
+        'scales': args.scales,
+        'preset': args.preset,
+        'pixelFormat': args.pixel_format,
+        'premultiplied': args.premultiplied,
+        'dither': args.dither,
+        'precision': args.precision,
+        'only': args.only,
+        'memoryBudget': args.memory_budget,
+        'diff': not args.no_diff,
+    }
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(
+            lambda document: runDocument(args.krita, document, outputDirectory(args.output, document), options),
+            documents))
+    elapsed = time.perf_counter() - start
+
+    failures = 0
+    for result in results:
+        status = 'ok' if result['ok'] else 'FAILED'
+        print('{0:8.2f}s  {1:6}  {2}'.format(result['seconds'], status, result['file']))
+        for line in result.get('summary', []):
+            print('                   {0}'.format(line))
+        if not result['ok']:
+            failures += 1
+            print(result.get('error', ''), file=sys.stderr)
+    print('{0} documents, {1} failed, {2:.2f}s'.format(len(results), failures, elapsed))
+
+    return 1 if failures else 0
+
+
+def parseScales(value):
+    try:
+        return [float(scale) for scale in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected comma separated numbers, e.g. 1,0.5,0.25')
+
+
+def expandDocuments(patterns):
+    documents = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for match in matches:
+            path = os.path.abspath(match)
+            if path not in documents:
+                documents.append(path)
+    return documents
+
+
+def outputDirectory(root, document):
+    return os.path.join(os.path.abspath(root), os.path.splitext(os.path.basename(document))[0])
+
+
+def runDocument(runner, document, directory, options):
+    start = time.perf_counter()
+    handle, resultFileName = tempfile.mkstemp(suffix='.json')
+    os.close(handle)
+
+    try:
+        command = [runner, '-s', 'KritaToSpine.batchexport', '-f', 'exportFile',
+                   document, directory, resultFileName, json.dumps(options)]
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        try:
+            with open(resultFileName) as infile:
+                result = json.load(infile)
+        except ValueError:
+            # kritarunner exited before the export wrote its result
+            result = {
+                'file': document,
+                'ok': False,
+                'error': 'kritarunner exited with {0}\n{1}'.format(process.returncode, process.stdout),
+            }
+    except OSError as error:
+        result = {'file': document, 'ok': False, 'error': str(error)}
+    finally:
+        os.remove(resultFileName)
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def exportFile(args):
+    # Entry point called by kritarunner inside the Krita process
+    fileName, directory, resultFileName, options = args
+    options = json.loads(options)
+    result = {'file': fileName, 'ok': False}
+
+    try:
+        from krita import Krita
+        from . import atlaspacker
+        from . import exportprofiler
+        from . import pngwriter
+        from .SpineExport import SpineExport
+
+        kritaInstance = Krita.instance()
+        kritaInstance.setBatchmode(True)
+        document = kritaInstance.openDocument(fileName)
+        if document is None:
+            raise IOError('Could not open {0}'.format(fileName))
+
+        exporter = SpineExport()
+        exporter.headless = True
+        exporter.workers = options['workers']
+        exporter.trim = options['trim']
+        exporter.useCache = options['cache']
+        exporter.atlasPacker = atlaspacker.AtlasPacker(options['atlasSize'], options['atlasSize']) if options['atlas'] else None
+        exporter.jsonIndent = None if options['compact'] else 2
+        exporter.jsonPrecision = options['precision']
+        exporter.outputFormat = options['format']
+        exporter.scales = options['scales']
+        exporter.compression = pngwriter.PRESETS[options['preset']]
+        exporter.pixelFormat = options['pixelFormat']
+        exporter.premultipliedAlpha = options['premultiplied']
+        exporter.dither = options['dither']
+        exporter.partial = options['only']
+        exporter.memoryBudget = options['memoryBudget'] * 1048576
+        exporter.diffReport = options['diff']
+        if options['profile']:
+            exporter.profiler = exportprofiler.ExportProfiler()
+
+        os.makedirs(directory, exist_ok=True)
+        try:
+            exporter.exportDocument(document, directory)
+        finally:
+            document.close()
+        if options['profile']:
+            exporter.profiler.writeTrace(os.path.join(directory, 'spine.trace.json'))
+
+        result['ok'] = True
+        result['summary'] = exporter.summary()
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    with open(resultFileName, 'w') as outfile:
+        json.dump(result, outfile)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
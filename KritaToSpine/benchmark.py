@@ -0,0 +1,278 @@
+# Export throughput benchmark on synthetic layer trees
+# Builds FakeDocuments with a configurable mix of (bone), (slot), (merge) and
+# [ignore] groups, exports them and reports the walk, encode and JSON phases:
+#
+#   python -m KritaToSpine.benchmark --layers 2000 --output bench.json
+#   python -m KritaToSpine.benchmark --layers 2000 --compare bench.json
+#
+# It also reports how long importing the exporter takes in a fresh
+# interpreter. Run inside Krita it times opening the export dialog as well:
+#
+#   kritarunner -s KritaToSpine.benchmark -f main
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import atlaspacker
+from . import layernodes
+from .SpineExport import SpineExport
+
+GROUP_KINDS = ('bone', 'slot', 'merge', 'ignore', 'group')
+DEFAULT_WEIGHTS = {'bone': 3, 'slot': 3, 'merge': 1, 'ignore': 1, 'group': 2}
+
+
+def generateDocument(layers=1000, depth=4, fanout=8, minSize=16, maxSize=256,
+                     groupRatio=0.25, weights=None, canvasSize=4096, seed=0):
+    # weights gives the relative frequency of each kind in GROUP_KINDS
+    weights = weights or DEFAULT_WEIGHTS
+    kinds = [kind for kind in GROUP_KINDS if weights.get(kind)]
+    kindWeights = [weights[kind] for kind in kinds]
+    rng = random.Random(seed)
+    counter = {'layers': 0, 'groups': 0}
+
+    def makeLayer():
+        index = counter['layers']
+        counter['layers'] += 1
+        width = rng.randint(minSize, maxSize)
+        height = rng.randint(minSize, maxSize)
+        x = rng.randint(0, canvasSize - width)
+        y = rng.randint(0, canvasSize - height)
+        return layernodes.FakeNode('layer{0}'.format(index), bounds=(x, y, width, height),
+                                   pixels=_pixels(rng, width, height))
+
+    def makeGroup(level):
+        index = counter['groups']
+        counter['groups'] += 1
+        kind = rng.choices(kinds, kindWeights)[0]
+        name = 'group{0}'.format(index) if kind == 'group' else 'group{0} ({1})'.format(index, kind)
+        if kind == 'ignore':
+            name = 'group{0} [ignore]'.format(index)
+
+        children = []
+        while counter['layers'] < layers and len(children) < fanout:
+            if level < depth and rng.random() < groupRatio:
+                children.append(makeGroup(level + 1))
+            else:
+                children.append(makeLayer())
+        if not children:
+            children.append(makeLayer())
+        return layernodes.FakeNode(name, children)
+
+    children = []
+    while counter['layers'] < layers:
+        children.append(makeGroup(1) if rng.random() < groupRatio else makeLayer())
+    return layernodes.FakeDocument(layernodes.FakeNode('root', children)), counter
+
+
+def _pixels(rng, width, height):
+    # Rows of seeded noise, shifted per row so zlib has something to match,
+    # inside a transparent border for the trim stage
+    border = min(width, height) // 8
+    row = bytearray(rng.getrandbits(8) for _ in range(width * 4))
+    row[3::4] = b'\xff' * width
+    row[:border * 4] = bytes(border * 4)
+    row[len(row) - border * 4:] = bytes(border * 4)
+    empty = bytes(width * 4)
+
+    rows = []
+    for y in range(height):
+        if y < border or y >= height - border:
+            rows.append(empty)
+        else:
+            shift = (y % width) * 4
+            shifted = row[shift:] + row[:shift]
+            rows.append(bytes(shifted))
+    return b''.join(rows)
+
+
+def runExport(document, workers, atlas=False, trim=True):
+    directory = tempfile.mkdtemp(prefix='spine-benchmark-')
+    try:
+        exporter = SpineExport()
+        exporter.headless = True
+        exporter.useCache = False
+        exporter.workers = workers
+        exporter.trim = trim
+        exporter.atlasPacker = atlaspacker.AtlasPacker() if atlas else None
+
+        start = time.perf_counter()
+        exporter.exportDocument(document, directory)
+        total = time.perf_counter() - start
+        stats = exporter.stats
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    megabytes = stats['bytesWritten'] / (1024.0 * 1024.0)
+    return {
+        'seconds': total,
+        'walkSeconds': stats['walkSeconds'],
+        'encodeSeconds': stats['encodeSeconds'],
+        'jsonSeconds': stats['jsonSeconds'],
+        'layers': stats['layers'],
+        'imagesWritten': stats['imagesWritten'],
+        'bytesWritten': stats['bytesWritten'],
+        'layersPerSecond': stats['layers'] / total if total else 0.0,
+        'megabytesPerSecond': megabytes / total if total else 0.0,
+        'peakRssKilobytes': peakRss(),
+    }
+
+
+def measureStartup():
+    # Seconds to import the exporter in a fresh interpreter
+    code = ('import time; start = time.perf_counter(); import KritaToSpine.SpineExport; '
+            'print(time.perf_counter() - start)')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        output = subprocess.check_output([sys.executable, '-c', code], cwd=root, universal_newlines=True)
+        return float(output.strip().splitlines()[-1])
+    except (OSError, subprocess.CalledProcessError, ValueError):
+        return None
+
+
+def measureDialog():
+    # Seconds to open the export dialog the first time and again after
+    # closing it, None outside of Krita
+    try:
+        import krita  # noqa: F401
+    except ImportError:
+        return None
+    from . import uidocumenttools
+
+    tools = uidocumenttools.UIDocumentTools()
+    tools.initialize()
+    tools.mainDialog.close()
+    first = tools.openSeconds
+    tools.initialize()
+    tools.mainDialog.close()
+    return {'firstOpenSeconds': first, 'reopenSeconds': tools.openSeconds}
+
+
+def peakRss():
+    # Peak resident set size of the whole process so far
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == 'darwin' else usage
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def printRun(label, run):
+    print('{0}: {1:.3f}s (walk {2:.3f}s, encode {3:.3f}s, json {4:.3f}s), '
+          '{5:.0f} layers/s, {6:.2f} MB/s, peak RSS {7} KB'.format(
+              label, run['seconds'], run['walkSeconds'], run['encodeSeconds'], run['jsonSeconds'],
+              run['layersPerSecond'], run['megabytesPerSecond'], run['peakRssKilobytes']))
+
+
+def printStartup(startup):
+    print('startup: import {0}, dialog {1}'.format(
+        '{0:.3f}s'.format(startup['importSeconds']) if startup['importSeconds'] is not None else 'n/a',
+        '{0:.3f}s, reopened {1:.3f}s'.format(startup['dialog']['firstOpenSeconds'], startup['dialog']['reopenSeconds'])
+        if startup['dialog'] else 'n/a (needs Krita)'))
+
+
+def compare(results, previous):
+    def best(runs, key):
+        return min(run[key] for run in runs)
+
+    old = previous.get('startup', {}).get('importSeconds')
+    new = results['startup']['importSeconds']
+    if old and new is not None:
+        print('{0:14} {1:8.3f}s -> {2:8.3f}s ({3:+.1f}%)'.format('importSeconds', old, new, (new - old) / old * 100.0))
+
+    for key in ('seconds', 'walkSeconds', 'encodeSeconds', 'jsonSeconds'):
+        old = best(previous['runs'], key)
+        new = best(results['runs'], key)
+        change = (new - old) / old * 100.0 if old else 0.0
+        print('{0:14} {1:8.3f}s -> {2:8.3f}s ({3:+.1f}%)'.format(key, old, new, change))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='KritaToSpine.benchmark', description='Benchmark the Spine export on synthetic documents.')
+    parser.add_argument('--layers', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=4, help='Maximum group nesting')
+    parser.add_argument('--fanout', type=int, default=8, help='Maximum children per group')
+    parser.add_argument('--min-size', type=int, default=16, help='Minimum layer width and height')
+    parser.add_argument('--max-size', type=int, default=256, help='Maximum layer width and height')
+    parser.add_argument('--group-ratio', type=float, default=0.25, help='Chance that a child is a group')
+    for kind in GROUP_KINDS:
+        parser.add_argument('--{0}'.format(kind), type=float, default=None, help='Relative weight of {0} groups'.format(kind))
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--atlas', action='store_true')
+    parser.add_argument('--no-trim', action='store_true')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Results JSON of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    weights = dict(DEFAULT_WEIGHTS)
+    for kind in GROUP_KINDS:
+        if getattr(args, kind) is not None:
+            weights[kind] = getattr(args, kind)
+
+    config = {
+        'layers': args.layers,
+        'depth': args.depth,
+        'fanout': args.fanout,
+        'minSize': args.min_size,
+        'maxSize': args.max_size,
+        'groupRatio': args.group_ratio,
+        'weights': weights,
+        'workers': args.workers,
+        'atlas': args.atlas,
+        'trim': not args.no_trim,
+        'seed': args.seed,
+    }
+
+    start = time.perf_counter()
+    document, counts = generateDocument(args.layers, args.depth, args.fanout, args.min_size, args.max_size,
+                                        args.group_ratio, weights, seed=args.seed)
+    print('Generated {0} layers in {1} groups in {2:.2f}s'.format(
+        counts['layers'], counts['groups'], time.perf_counter() - start))
+
+    startup = {'importSeconds': measureStartup(), 'dialog': measureDialog()}
+    printStartup(startup)
+
+    runs = []
+    for index in range(args.repeat):
+        run = runExport(document, args.workers, args.atlas, not args.no_trim)
+        printRun('run {0}'.format(index + 1), run)
+        runs.append(run)
+
+    results = {
+        'revision': gitRevision(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'config': config,
+        'startup': startup,
+        'runs': runs,
+    }
+
+    if args.compare:
+        with open(args.compare) as infile:
+            compare(results, json.load(infile))
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# Combined transform of the tool tabs
+# Scale, canvas size and rotate are collected into one affine matrix, layers
+# are then resampled once while they are exported (layernodes.TransformedNode)
+# instead of running scaleImage, resizeImage and rotateImage on a clone of the
+# whole document. Layer bounds, and with them the bone and attachment
+# positions, are mapped analytically. The pixels are resampled bilinearly,
+# other scale filters are left to Krita.
+
+import math
+
+from . import layernodes
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+class DocumentTransform(object):
+    # matrix is (m11, m12, m21, m22, dx, dy) in QTransform order:
+    #   x' = m11 * x + m21 * y + dx
+    #   y' = m12 * x + m22 * y + dy
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.matrix = IDENTITY
+        self.filter = 'Bilinear'
+
+    def isIdentity(self):
+        return self.matrix == IDENTITY
+
+    def scale(self, width, height, strategy='Bilinear'):
+        # Same as Document.scaleImage
+        if (width, height) != (self.width, self.height):
+            self._then(width / self.width, 0.0, 0.0, height / self.height, 0.0, 0.0)
+            self.filter = strategy
+        self.width = width
+        self.height = height
+
+    def resize(self, x, y, width, height):
+        # Same as Document.resizeImage, x and y are the new canvas origin.
+        # Like Krita, layers are not cropped to the canvas
+        if x or y:
+            self._then(1.0, 0.0, 0.0, 1.0, -x, -y)
+        self.width = width
+        self.height = height
+
+    def rotate(self, degrees):
+        # Same as Document.rotateImage: clockwise around the canvas center,
+        # the canvas grows to the bounds of the rotated image
+        if degrees % 360 == 0:
+            return
+        radians = math.radians(degrees)
+        cos = round(math.cos(radians), 12)
+        sin = round(math.sin(radians), 12)
+        width = abs(cos) * self.width + abs(sin) * self.height
+        height = abs(sin) * self.width + abs(cos) * self.height
+
+        self._then(1.0, 0.0, 0.0, 1.0, -self.width / 2.0, -self.height / 2.0)
+        self._then(cos, sin, -sin, cos, 0.0, 0.0)
+        self._then(1.0, 0.0, 0.0, 1.0, width / 2.0, height / 2.0)
+        self.width = int(math.ceil(round(width, 6)))
+        self.height = int(math.ceil(round(height, 6)))
+
+    def map(self, x, y):
+        m11, m12, m21, m22, dx, dy = self.matrix
+        return m11 * x + m21 * y + dx, m12 * x + m22 * y + dy
+
+    def mapRect(self, rect):
+        # Bounding rect of the transformed rect, in whole pixels
+        if rect.isEmpty():
+            return layernodes.Rect()
+        right = rect.x() + rect.width()
+        bottom = rect.y() + rect.height()
+        points = ((rect.x(), rect.y()), (right, rect.y()), (rect.x(), bottom), (right, bottom))
+        corners = [self.map(x, y) for x, y in points]
+        left = int(math.floor(round(min(x for x, y in corners), 6)))
+        top = int(math.floor(round(min(y for x, y in corners), 6)))
+        right = int(math.ceil(round(max(x for x, y in corners), 6)))
+        bottom = int(math.ceil(round(max(y for x, y in corners), 6)))
+        return layernodes.Rect(left, top, right - left, bottom - top)
+
+    def inverted(self):
+        m11, m12, m21, m22, dx, dy = self.matrix
+        determinant = m11 * m22 - m12 * m21
+        result = DocumentTransform(self.width, self.height)
+        result.matrix = (m22 / determinant, -m12 / determinant, -m21 / determinant, m11 / determinant,
+                         (m21 * dy - m22 * dx) / determinant, (m12 * dx - m11 * dy) / determinant)
+        return result
+
+    def sourceRect(self, target, bounds):
+        # Part of the layer bounds the pixels of the target rect are sampled
+        # from, with a margin for the smooth filter
+        if target.isEmpty():
+            return layernodes.Rect()
+        rect = self.inverted().mapRect(target)
+        rect = layernodes.Rect(rect.x() - 2, rect.y() - 2, rect.width() + 4, rect.height() + 4)
+        return rect.intersected(bounds)
+
+    def isBilinear(self):
+        # resample matches Krita only for the Bilinear scale filter
+        return self.filter == 'Bilinear'
+
+    def resample(self, pixelData, source, target):
+        # Transforms the BGRA pixels of the source rect and returns the BGRA
+        # pixels of the target rect, in transformed coordinates
+        if source.isEmpty() or target.isEmpty():
+            return bytes(max(target.width(), 0) * max(target.height(), 0) * 4)
+
+        from PyQt5.QtCore import Qt
+        from PyQt5.QtGui import QImage, QPainter, QTransform
+
+        # ARGB32 is stored as BGRA bytes on little endian machines, like Krita's pixel data
+        image = QImage(pixelData, source.width(), source.height(), source.width() * 4, QImage.Format_ARGB32)
+        result = QImage(target.width(), target.height(), QImage.Format_ARGB32_Premultiplied)
+        result.fill(Qt.transparent)
+
+        m11, m12, m21, m22, dx, dy = self.matrix
+        painter = QPainter(result)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)
+        painter.setTransform(QTransform(m11, m12, m21, m22, dx - target.x(), dy - target.y()))
+        painter.drawImage(source.x(), source.y(), image)
+        painter.end()
+
+        result = result.convertToFormat(QImage.Format_ARGB32)
+        bits = result.constBits()
+        bits.setsize(result.bytesPerLine() * result.height())
+        return bytes(bits)
+
+    def _then(self, n11, n12, n21, n22, ndx, ndy):
+        # Appends a transform, applied after the current one
+        m11, m12, m21, m22, dx, dy = self.matrix
+        self.matrix = (m11 * n11 + m12 * n21, m11 * n12 + m12 * n22,
+                       m21 * n11 + m22 * n21, m21 * n12 + m22 * n22,
+                       dx * n11 + dy * n21 + ndx, dx * n12 + dy * n22 + ndy)
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+
+
+class ExportCache(object):
+    # Manifest of the images written into one output directory, used to skip
+    # re-saving layers whose pixels, bounds and export settings did not change
+
+    manifestName = '.spine-export-cache.json'
+    version = 1
+
+    def __init__(self, directory, settings):
+        self.directory = directory
+        self.settings = settings
+        self.entries = {}
+        self.previous = self._load()
+        self.skipped = 0
+
+    @staticmethod
+    def digest(pixelData):
+        return hashlib.sha1(pixelData).hexdigest()
+
+    @staticmethod
+    def hasher():
+        # Same digest for pixels read in parts, update() it with every part
+        return hashlib.sha1()
+
+    def isCurrent(self, fileName, digest, bounds):
+        # Registers the layer for this export and tells whether its file on disk can be kept
+        entry = {
+            'hash': digest,
+            'bounds': list(bounds),
+            'settings': self.settings,
+        }
+        # Two layers sharing a file name overwrite each other, never trust the cache for them
+        duplicate = fileName in self.entries
+        self.entries[fileName] = entry
+
+        if duplicate or self.previous.get(fileName) != entry:
+            return False
+        if not os.path.exists(os.path.join(self.directory, fileName)):
+            return False
+        self.skipped += 1
+        return True
+
+    def removeStale(self):
+        for fileName in self.previous:
+            if fileName in self.entries:
+                continue
+            path = os.path.join(self.directory, fileName)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def save(self, keepPrevious=False):
+        # keepPrevious keeps the entries of layers this export did not visit,
+        # for partial exports
+        entries = self.entries
+        if keepPrevious:
+            entries = dict(self.previous, **self.entries)
+        manifest = {
+            'version': self.version,
+            'layers': entries,
+        }
+        with open(os.path.join(self.directory, self.manifestName), 'w') as outfile:
+            json.dump(manifest, outfile)
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, self.manifestName)) as infile:
+                manifest = json.load(infile)
+        except (IOError, ValueError):
+            return {}
+
+        if manifest.get('version') != self.version:
+            return {}
+        return manifest.get('layers', {})
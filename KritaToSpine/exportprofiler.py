@@ -0,0 +1,100 @@
+import json
+import threading
+import time
+
+
+class NullProfiler(object):
+    # Used when profiling is off, every call is a no-op
+
+    enabled = False
+
+    def phase(self, name, category='export', layer=None):
+        return _NULL_PHASE
+
+    def call(self, name, category, layer, function, *args):
+        return function(*args)
+
+    def slowestLayers(self, count):
+        return []
+
+
+class _NullPhase(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_PHASE = _NullPhase()
+
+
+class ExportProfiler(object):
+    # Records wall time per phase and per layer. Events are kept in the Chrome
+    # trace event format, which chrome://tracing, Perfetto and speedscope load
+
+    enabled = True
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.events = []
+        self.layers = {}
+        self.lock = threading.Lock()
+
+    def phase(self, name, category='export', layer=None):
+        return _Phase(self, name, category, layer)
+
+    def call(self, name, category, layer, function, *args):
+        # Times function, an int result is counted as bytes written for the layer
+        start = time.perf_counter()
+        result = function(*args)
+        written = result if isinstance(result, int) else 0
+        self.record(name, category, layer, start, time.perf_counter(), written)
+        return result
+
+    def record(self, name, category, layer, start, end, written=0):
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            'ts': (start - self.origin) * 1e6,
+            'dur': (end - start) * 1e6,
+            'pid': 1,
+            'tid': threading.get_ident(),
+        }
+        if written:
+            event['args'] = {'bytes': written}
+
+        with self.lock:
+            self.events.append(event)
+            if layer is not None:
+                seconds, total = self.layers.get(layer, (0.0, 0))
+                self.layers[layer] = (seconds + end - start, total + written)
+
+    def slowestLayers(self, count):
+        # [(layer, seconds, bytes)], slowest first
+        layers = sorted(self.layers.items(), key=lambda item: item[1][0], reverse=True)
+        return [(layer, seconds, written) for layer, (seconds, written) in layers[:count]]
+
+    def writeTrace(self, fileName):
+        with open(fileName, 'w') as outfile:
+            json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms'}, outfile)
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name, category, layer):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.layer = layer
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.category, self.layer, self.start, time.perf_counter())
+        return False
@@ -0,0 +1,72 @@
+# Watch mode: exports documents again whenever they are saved in Krita
+# Saves are debounced, a burst of saves exports once. Only layers whose
+# pixels, bounds or settings changed since the last export are encoded again
+# (the ExportCache manifest holds a fingerprint per layer) and spine.json is
+# only replaced when the skeleton changed, so an editor watching the folder
+# reloads once per save.
+
+import traceback
+
+from krita import Krita
+from PyQt5.QtCore import QObject, QTimer
+from PyQt5.QtWidgets import QMessageBox
+
+
+class ExportWatcher(QObject):
+
+    def __init__(self, delay=300, parent=None):
+        super(ExportWatcher, self).__init__(parent)
+        # fileName: (directory, export function)
+        self.watched = {}
+        self.pending = []
+        # Set while the dialog exports, saves are exported once it is done
+        self.paused = False
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self._exportPending)
+
+        self.notifier = Krita.instance().notifier()
+        self.notifier.setActive(True)
+        self.notifier.imageSaved.connect(self._imageSaved)
+        self.notifier.imageClosed.connect(self._imageClosed)
+
+    def watch(self, document, directory, export):
+        # export(document, directory) is called after every save of document
+        self.watched[document.fileName()] = (directory, export)
+
+    def unwatch(self, document):
+        self.watched.pop(document.fileName(), None)
+
+    def isWatching(self, document):
+        return document.fileName() in self.watched
+
+    def _imageSaved(self, fileName):
+        if fileName not in self.watched:
+            return
+        if fileName not in self.pending:
+            self.pending.append(fileName)
+        # Restarting the timer debounces saves that follow each other closely
+        self.timer.start()
+
+    def _imageClosed(self, fileName):
+        self.watched.pop(fileName, None)
+
+    def _exportPending(self):
+        if self.paused:
+            self.timer.start()
+            return
+        documents = dict((document.fileName(), document) for document in Krita.instance().documents())
+        pending, self.pending = self.pending, []
+        for fileName in pending:
+            if fileName not in self.watched or fileName not in documents:
+                continue
+            directory, export = self.watched[fileName]
+            try:
+                export(documents[fileName], directory)
+            except Exception:
+                # Errors must not escape a Qt slot, stop watching and tell why
+                self.watched.pop(fileName, None)
+                QMessageBox.warning(None, i18n("Spine Export"), i18n("Stopped watching {0}:\n{1}").format(
+                    fileName, traceback.format_exc()))
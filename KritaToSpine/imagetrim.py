@@ -0,0 +1,61 @@
+def alphaMask(data, threshold=0):
+    # One byte per pixel, zero where the pixel counts as transparent
+    alpha = data[3::4]
+    if threshold:
+        alpha = alpha.translate(bytes(0 if value <= threshold else 1 for value in range(256)))
+    return bytes(alpha)
+
+
+def trimBounds(data, width, height, threshold=0):
+    # Tight (x, y, width, height) box around the pixels whose alpha is above
+    # threshold, None when the image is fully transparent. The scans run on
+    # whole rows with bytes.strip instead of looping over pixels
+    mask = alphaMask(data, threshold)
+    content = mask.rstrip(b'\x00')
+    if not content:
+        return None
+
+    top = (len(mask) - len(mask.lstrip(b'\x00'))) // width
+    bottom = (len(content) - 1) // width + 1
+
+    left = width
+    right = 0
+    for offset in range(top * width, bottom * width, width):
+        row = mask[offset:offset + width]
+        stripped = row.rstrip(b'\x00')
+        if not stripped:
+            continue
+        right = max(right, len(stripped))
+        left = min(left, width - len(row.lstrip(b'\x00')))
+
+    return (left, top, right - left, bottom - top)
+
+
+def trimStrips(strips, width, threshold=0):
+    # trimBounds of an image read as (data, height) strips, top to bottom
+    top = None
+    bottom = 0
+    left = width
+    right = 0
+    y = 0
+    for data, height in strips:
+        bounds = trimBounds(data, width, height, threshold)
+        if bounds:
+            x, stripTop, stripWidth, stripHeight = bounds
+            if top is None:
+                top = y + stripTop
+            bottom = y + stripTop + stripHeight
+            left = min(left, x)
+            right = max(right, x + stripWidth)
+        y += height
+    if top is None:
+        return None
+    return (left, top, right - left, bottom - top)
+
+
+def crop(data, width, x, y, cropWidth, cropHeight):
+    stride = width * 4
+    view = memoryview(data)
+    return b''.join(
+        view[offset + x * 4:offset + (x + cropWidth) * 4]
+        for offset in range(y * stride, (y + cropHeight) * stride, stride))
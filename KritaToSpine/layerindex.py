@@ -0,0 +1,105 @@
+# Flat index of the layers an export visits, built in one pass over the tree
+# Every node is asked for its name, type, visibility, bounds and children once
+# and its name tags are parsed once, the export then walks the index instead
+# of the node adapters. Hidden, [ignore] and selection mask nodes are left out
+# together with their children.
+
+import re
+
+GROUP = 'group'
+IMAGE = 'image'
+
+
+class NameParser(object):
+    # Parses the (bone), (slot), (skin), (merge) and [ignore] tags of layer
+    # names, results are memoized per name
+
+    def __init__(self):
+        self.bonePattern = re.compile(r"\(bone\)|\[bone\]", re.IGNORECASE)
+        self.mergePattern = re.compile(r"\(merge\)|\[merge\]", re.IGNORECASE)
+        self.slotPattern = re.compile(r"\(slot\)|\[slot\]", re.IGNORECASE)
+        self.skinPattern = re.compile(r"\(skin\)|\[skin\]", re.IGNORECASE)
+        self.parsed = {}
+
+    def parse(self, name):
+        tags = self.parsed.get(name)
+        if tags is None:
+            tags = self.parsed[name] = LayerTags(
+                bone=self._clean(self.bonePattern, name),
+                slot=self._clean(self.slotPattern, name),
+                skin=self._clean(self.skinPattern, name),
+                merge=bool(self.mergePattern.search(name)),
+                ignore='[ignore]' in name,
+                imageName=self.mergePattern.sub('', name).strip())
+        return tags
+
+    @staticmethod
+    def _clean(pattern, name):
+        # Name without the tag, None when the tag is missing
+        if not pattern.search(name):
+            return None
+        return pattern.sub('', name).strip()
+
+
+class LayerTags(object):
+    __slots__ = ('bone', 'slot', 'skin', 'merge', 'ignore', 'imageName')
+
+    def __init__(self, bone, slot, skin, merge, ignore, imageName):
+        self.bone = bone
+        self.slot = slot
+        self.skin = skin
+        self.merge = merge
+        self.ignore = ignore
+        self.imageName = imageName
+
+
+class LayerRecord(object):
+    # kind is GROUP for groups the export descends into, IMAGE for layers and
+    # (merge) groups saved as one image. parent is the index of the parent
+    # record, -1 for the root. path joins the names below the root with '/'
+    __slots__ = ('index', 'parent', 'node', 'name', 'path', 'kind', 'tags', 'bounds', 'children')
+
+    def __init__(self, index, parent, node, name, path, kind, tags, bounds):
+        self.index = index
+        self.parent = parent
+        self.node = node
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.tags = tags
+        self.bounds = bounds
+        self.children = []
+
+
+class LayerIndex(object):
+
+    def __init__(self, rootNode, parser=None):
+        self.parser = parser or NameParser()
+        self.records = []
+        # Number of IMAGE records, the layers the export will save
+        self.imageCount = 0
+        self.root = LayerRecord(0, -1, rootNode, rootNode.name(), '', GROUP, None, None)
+        self.records.append(self.root)
+        self._addChildren(self.root, rootNode.childNodes())
+
+    def _addChildren(self, parent, children):
+        for child in children:
+            if "selectionmask" in child.type():
+                continue
+            if not child.visible():
+                continue
+            name = child.name()
+            tags = self.parser.parse(name)
+            if tags.ignore:
+                continue
+
+            grandChildren = child.childNodes()
+            kind = GROUP if grandChildren and not tags.merge else IMAGE
+            path = '{0}/{1}'.format(parent.path, name) if parent.path else name
+            record = LayerRecord(len(self.records), parent.index, child, name, path, kind, tags, child.bounds())
+            self.records.append(record)
+            parent.children.append(record)
+            if kind == GROUP:
+                self._addChildren(record, grandChildren)
+            else:
+                self.imageCount += 1
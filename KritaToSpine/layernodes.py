@@ -0,0 +1,331 @@
+# Node adapters used by SpineExport to walk the layer tree
+# KritaNode wraps a krita.Node, FakeNode is an in-memory layer that lets the
+# whole export run (and be profiled) without Krita. Both provide:
+#
+#   name(), type(), visible(), opacity(), bounds(), childNodes(), colorModel(),
+#   colorDepth(), pixelData(rect) -> 8 bit BGRA bytes, save(fileName)
+#
+# pixelData is the layer's projection without its own opacity, which Krita
+# only applies when compositing the layer into its parent, see applyOpacity
+
+from . import pngwriter
+
+
+class Rect(object):
+    # Same accessors as QRect, right() and bottom() are inclusive
+    __slots__ = ('_x', '_y', '_width', '_height')
+
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self._x = x
+        self._y = y
+        self._width = width
+        self._height = height
+
+    def x(self):
+        return self._x
+
+    def y(self):
+        return self._y
+
+    def left(self):
+        return self._x
+
+    def top(self):
+        return self._y
+
+    def width(self):
+        return self._width
+
+    def height(self):
+        return self._height
+
+    def right(self):
+        return self._x + self._width - 1
+
+    def bottom(self):
+        return self._y + self._height - 1
+
+    def isEmpty(self):
+        return self._width <= 0 or self._height <= 0
+
+    def united(self, other):
+        if self.isEmpty():
+            return other
+        if other.isEmpty():
+            return self
+        left = min(self._x, other._x)
+        top = min(self._y, other._y)
+        right = max(self._x + self._width, other._x + other._width)
+        bottom = max(self._y + self._height, other._y + other._height)
+        return Rect(left, top, right - left, bottom - top)
+
+    def intersected(self, other):
+        left = max(self._x, other._x)
+        top = max(self._y, other._y)
+        right = min(self._x + self._width, other._x + other._width)
+        bottom = min(self._y + self._height, other._y + other._height)
+        if left >= right or top >= bottom:
+            return Rect()
+        return Rect(left, top, right - left, bottom - top)
+
+    def __eq__(self, other):
+        return isinstance(other, Rect) and self.toTuple() == other.toTuple()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self.toTuple())
+
+    def __repr__(self):
+        return 'Rect({0}, {1}, {2}, {3})'.format(*self.toTuple())
+
+    def toTuple(self):
+        return (self._x, self._y, self._width, self._height)
+
+
+def applyOpacity(data, opacity):
+    # Alpha of 8 bit BGRA pixels multiplied by a layer opacity of 0 to 255,
+    # like Node.save does
+    if opacity >= 255:
+        return data
+    pixels = bytearray(data)
+    pixels[3::4] = pixels[3::4].translate(bytes((alpha * opacity + 127) // 255 for alpha in range(256)))
+    return bytes(pixels)
+
+
+def adaptDocument(document):
+    if isinstance(document, (KritaDocument, FakeDocument, TransformedDocument)):
+        return document
+    return KritaDocument(document)
+
+
+class KritaDocument(object):
+
+    def __init__(self, document):
+        self.document = document
+
+    def rootNode(self):
+        return KritaNode(self.document.rootNode())
+
+    def colorModel(self):
+        return self.document.colorModel()
+
+    def colorDepth(self):
+        return self.document.colorDepth()
+
+    def setBatchmode(self, enabled):
+        from krita import Krita
+        Krita.instance().setBatchmode(enabled)
+
+
+class KritaNode(object):
+    __slots__ = ('node', '_bounds')
+
+    def __init__(self, node):
+        self.node = node
+        self._bounds = None
+
+    def name(self):
+        return self.node.name()
+
+    def type(self):
+        return self.node.type()
+
+    def visible(self):
+        return self.node.visible()
+
+    def bounds(self):
+        if self._bounds is None:
+            rect = self.node.bounds()
+            self._bounds = Rect(rect.x(), rect.y(), rect.width(), rect.height())
+        return self._bounds
+
+    def childNodes(self):
+        return [KritaNode(child) for child in self.node.childNodes()]
+
+    def colorModel(self):
+        return self.node.colorModel()
+
+    def colorDepth(self):
+        return self.node.colorDepth()
+
+    def opacity(self):
+        return self.node.opacity()
+
+    def pixelData(self, rect):
+        return bytes(self.node.projectionPixelData(rect.x(), rect.y(), rect.width(), rect.height()))
+
+    def save(self, fileName):
+        from krita import InfoObject
+        self.node.save(fileName, 96, 96, InfoObject())
+
+
+class TransformedDocument(object):
+    # Wraps an adapted document, its layers are transformed by a
+    # documenttransform.DocumentTransform as they are read
+
+    def __init__(self, document, transform):
+        self.document = adaptDocument(document)
+        self.transform = transform
+
+    def rootNode(self):
+        return TransformedNode(self.document.rootNode(), self.transform)
+
+    def colorModel(self):
+        return self.document.colorModel()
+
+    def colorDepth(self):
+        return self.document.colorDepth()
+
+    def setBatchmode(self, enabled):
+        self.document.setBatchmode(enabled)
+
+
+class TransformedNode(object):
+    __slots__ = ('node', 'transform', '_bounds')
+
+    def __init__(self, node, transform):
+        self.node = node
+        self.transform = transform
+        self._bounds = None
+
+    def name(self):
+        return self.node.name()
+
+    def type(self):
+        return self.node.type()
+
+    def visible(self):
+        return self.node.visible()
+
+    def bounds(self):
+        if self._bounds is None:
+            self._bounds = self.transform.mapRect(self.node.bounds())
+        return self._bounds
+
+    def childNodes(self):
+        return [TransformedNode(child, self.transform) for child in self.node.childNodes()]
+
+    def colorModel(self):
+        return self.node.colorModel()
+
+    def colorDepth(self):
+        return self.node.colorDepth()
+
+    def opacity(self):
+        return self.node.opacity()
+
+    def pixelData(self, rect):
+        # Only the part of the source layer that rect is sampled from is read,
+        # so strips of a large layer read strips of the source
+        source = self.transform.sourceRect(rect, self.node.bounds())
+        return self.transform.resample(self.node.pixelData(source), source, rect)
+
+    def save(self, fileName):
+        rect = self.bounds()
+        pngwriter.writePng(fileName, applyOpacity(self.pixelData(rect), self.opacity()), rect.width(), rect.height())
+
+
+class FakeDocument(object):
+
+    def __init__(self, rootNode):
+        self._rootNode = rootNode
+
+    def rootNode(self):
+        return self._rootNode
+
+    def colorModel(self):
+        return 'RGBA'
+
+    def colorDepth(self):
+        return 'U8'
+
+    def setBatchmode(self, enabled):
+        pass
+
+
+class FakeNode(object):
+    # pixels is any buffer with width * height * 4 BGRA bytes for the node
+    # bounds (bytes, bytearray or a C contiguous uint8 NumPy array). Groups
+    # without pixels are composited from their children, bottom to top, by
+    # copying their non-empty rows without blending. opacity is 0 to 255
+
+    def __init__(self, name, children=None, bounds=None, pixels=None, visible=True, nodeType=None, opacity=255):
+        self._name = name
+        self._children = list(children or [])
+        self._visible = visible
+        self._opacity = opacity
+        self._type = nodeType or ('grouplayer' if self._children else 'paintlayer')
+
+        if bounds is None:
+            bounds = Rect()
+            for child in self._children:
+                bounds = bounds.united(child.bounds())
+        elif not isinstance(bounds, Rect):
+            bounds = Rect(*bounds)
+        self._bounds = bounds
+
+        if pixels is not None:
+            pixels = memoryview(pixels).cast('B').tobytes()
+            if len(pixels) != bounds.width() * bounds.height() * 4:
+                raise ValueError("{0}: expected {1}x{2} BGRA pixels".format(name, bounds.width(), bounds.height()))
+        self._pixels = pixels
+
+    def name(self):
+        return self._name
+
+    def type(self):
+        return self._type
+
+    def visible(self):
+        return self._visible
+
+    def opacity(self):
+        return self._opacity
+
+    def bounds(self):
+        return self._bounds
+
+    def childNodes(self):
+        return self._children
+
+    def colorModel(self):
+        return 'RGBA'
+
+    def colorDepth(self):
+        return 'U8'
+
+    def pixelData(self, rect):
+        result = bytearray(rect.width() * rect.height() * 4)
+        self._paint(result, rect)
+        return bytes(result)
+
+    def save(self, fileName):
+        rect = self._bounds
+        pngwriter.writePng(fileName, applyOpacity(self.pixelData(rect), self._opacity), rect.width(), rect.height())
+
+    def _paint(self, target, rect):
+        if self._pixels is None:
+            for child in self._children:
+                if child.visible():
+                    child._paint(target, rect)
+            return
+
+        # Copy the overlap of the node bounds and rect, row by row
+        own = self._bounds
+        left = max(own.x(), rect.x())
+        right = min(own.x() + own.width(), rect.x() + rect.width())
+        top = max(own.y(), rect.y())
+        bottom = min(own.y() + own.height(), rect.y() + rect.height())
+        if left >= right or top >= bottom:
+            return
+
+        rowBytes = (right - left) * 4
+        for y in range(top, bottom):
+            source = ((y - own.y()) * own.width() + left - own.x()) * 4
+            destination = ((y - rect.y()) * rect.width() + left - rect.x()) * 4
+            row = self._pixels[source:source + rowBytes]
+            if row.count(0) == rowBytes:
+                continue
+            target[destination:destination + rowBytes] = row
@@ -0,0 +1,78 @@
+# Partial export of bone and slot subtrees
+# Only the layers below the selected groups are saved again, the resulting
+# bones, slots and attachments are merged into the skeleton already in the
+# output directory and everything else in it is kept as it is. Layers deleted
+# from a selected subtree keep their attachment until the next full export.
+
+import fnmatch
+import json
+import os
+
+from . import layerindex
+from . import spinejson
+from . import spineskel
+
+
+class LayerSelection(object):
+    # selectors are bone names, slot names, image layer names or globs of
+    # layer paths, e.g. 'body (bone)/arm*'. Paths use the layer names as
+    # shown in Krita, separated by '/'
+
+    def __init__(self, selectors):
+        self.names = set()
+        self.patterns = []
+        for selector in selectors:
+            self.names.add(selector)
+            if '/' in selector or any(character in selector for character in '*?['):
+                self.patterns.append(selector)
+
+    def matches(self, record):
+        tags = record.tags
+        if record.kind == layerindex.GROUP:
+            if tags.bone in self.names or tags.slot in self.names:
+                return True
+        elif tags.imageName in self.names:
+            return True
+        return any(fnmatch.fnmatchcase(record.path, pattern) for pattern in self.patterns)
+
+
+def loadSkeleton(directory):
+    # The skeleton of an earlier export, from spine.json or else spine.skel
+    try:
+        with open(os.path.join(directory, 'spine.json')) as infile:
+            return spinejson.fromSpine38(json.load(infile))
+    except (IOError, ValueError):
+        pass
+    try:
+        with open(os.path.join(directory, 'spine.skel'), 'rb') as infile:
+            return spineskel.readSkeleton(infile.read())
+    except (IOError, ValueError, IndexError):
+        return None
+
+
+def mergeSkeleton(previous, partial):
+    # Bones and slots of partial replace the ones with the same name, new
+    # ones are appended, attachments are replaced one by one. The skeleton
+    # header is the one of the current export
+    result = dict(previous, skeleton=partial['skeleton'])
+    result['bones'] = _mergeNamed(previous.get('bones', []), partial['bones'])
+    result['slots'] = _mergeNamed(previous.get('slots', []), partial['slots'])
+    result['skins'] = dict((name, dict((slot, dict(attachments)) for slot, attachments in skin.items()))
+                           for name, skin in previous.get('skins', {}).items())
+    for name, skin in partial['skins'].items():
+        target = result['skins'].setdefault(name, {})
+        for slot, attachments in skin.items():
+            target.setdefault(slot, {}).update(attachments)
+    return result
+
+
+def _mergeNamed(previous, partial):
+    merged = list(previous)
+    positions = dict((item['name'], index) for index, item in enumerate(merged))
+    for item in partial:
+        if item['name'] in positions:
+            merged[positions[item['name']]] = item
+        else:
+            positions[item['name']] = len(merged)
+            merged.append(item)
+    return merged
@@ -0,0 +1,428 @@
+import os
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from operator import itemgetter
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# 96 dpi expressed in pixels per meter, same resolution Node.save is called with
+PIXELS_PER_METER = 3780
+
+# zlib level of each compression preset, filterTypes has the row filters of each level
+PRESETS = {'fast': 1, 'balanced': 6, 'smallest': 9}
+
+# rgba8888 keeps the pixels, rgba4444 rounds every channel to 4 bits and
+# indexed writes a palette PNG of at most 256 colors (see Palette). PNG has no
+# 4 bit RGBA color type, so rgba4444 values are stored on the 8 bit grid: the
+# file compresses better and loads into an RGBA4444 texture without further loss
+PIXEL_FORMATS = ('rgba8888', 'rgba4444', 'indexed')
+
+# Channel to 4 bits, repeated in the low nibble so 0xf0 becomes 0xff
+_TO_4444 = bytes(min(255, (value + 8) // 17 * 17) for value in range(256))
+# 4x4 Bayer matrix, rgba4444 with dithering adds its threshold before rounding
+_BAYER = ((0, 8, 2, 10), (12, 4, 14, 6), (3, 11, 1, 9), (15, 7, 13, 5))
+_DITHER_4444 = [[bytes(min(255, (value + (threshold * 17 + 8) // 16) // 17 * 17) for value in range(256))
+                 for threshold in row] for row in _BAYER]
+# Channel to the 5 bits Palette counts colors in, and back to 8 bits
+_TO_5BIT = bytes(value & 0xf8 for value in range(256))
+_FROM_5BIT = bytes(value | value >> 5 for value in range(256))
+_5BIT_MASK = 0xf8f8f8f8
+# Filtered byte to its distance from 0, the cost filters are chosen by
+_DISTANCE = bytes(min(value, 256 - value) for value in range(256))
+# Premultiplied channel at index alpha * 256 + channel
+_PREMULTIPLY = bytes((channel * alpha + 127) // 255 for alpha in range(256) for channel in range(256))
+
+
+def bgraToRgba(data):
+    # Krita stores 8 bit RGBA pixels as B, G, R, A
+    rgba = bytearray(data)
+    rgba[0::4] = data[2::4]
+    rgba[2::4] = data[0::4]
+    return rgba
+
+
+def premultiply(rgba, width, height):
+    # Color channels multiplied by alpha with one table lookup per channel.
+    # Opaque rows stay as they are and transparent runs at the row ends are
+    # cleared, only the pixels in between are looked up
+    stride = width * 4
+    low, high = (0, 1) if sys.byteorder == 'little' else (1, 0)
+    for start in range(0, stride * height, stride):
+        alpha = rgba[start + 3:start + stride:4]
+        if not alpha.strip(b'\xff'):
+            continue
+        left = (len(alpha) - len(alpha.lstrip(b'\x00'))) * 4
+        right = len(alpha.rstrip(b'\x00')) * 4
+        rgba[start:start + left] = bytes(left)
+        rgba[start + right:start + stride] = bytes(stride - right)
+        if left >= right:
+            continue
+
+        span = rgba[start + left:start + right]
+        alpha = span[3::4]
+        for channel in range(3):
+            # Native 16 bit keys of channel + alpha * 256
+            keys = bytearray(len(alpha) * 2)
+            keys[low::2] = span[channel::4]
+            keys[high::2] = alpha
+            span[channel::4] = bytes(map(_PREMULTIPLY.__getitem__, array('H', keys)))
+        rgba[start + left:start + right] = span
+    return rgba
+
+
+def dither4444(rgba, width, height, row=0):
+    # Ordered dithering of the color channels to 4 bits, alpha is rounded so
+    # edges stay clean. row is the image row of the first pixels, for strips
+    stride = width * 4
+    for y in range(height):
+        start = y * stride
+        line = rgba[start:start + stride]
+        for column, table in enumerate(_DITHER_4444[(row + y) % 4]):
+            for channel in range(column * 4, column * 4 + 3):
+                line[channel::16] = line[channel::16].translate(table)
+        line[3::4] = line[3::4].translate(_TO_4444)
+        rgba[start:start + stride] = line
+    return rgba
+
+
+def convert(data, width, height, pixelFormat='rgba8888', premultiplied=False, dither=False, row=0):
+    # BGRA to the RGBA pixels written for pixelFormat, before indexing.
+    # dither only applies to rgba4444, row is the image row data starts at
+    rgba = bgraToRgba(data)
+    if premultiplied:
+        rgba = premultiply(rgba, width, height)
+    if pixelFormat == 'rgba4444':
+        if dither:
+            rgba = dither4444(rgba, width, height, row)
+        else:
+            rgba = rgba.translate(_TO_4444)
+    return rgba
+
+
+def encodePng(data, width, height, compression=6, pixelFormat='rgba8888', premultiplied=False, dither=False):
+    # data is 8 bit BGRA as returned by Node.projectionPixelData
+    rgba = convert(data, width, height, pixelFormat, premultiplied, dither)
+
+    if pixelFormat == 'indexed':
+        palette = Palette()
+        palette.add(rgba)
+        palette.finish()
+        raw = _scanlines(memoryview(palette.index(rgba)), width, height)
+        chunks = _paletteChunks(width, height, palette.colors)
+    else:
+        raw = _scanlines(memoryview(rgba), width * 4, height, 4, None, filterTypes(compression))
+        chunks = [_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))]
+
+    return b''.join([PNG_SIGNATURE] + chunks + [
+        _chunk(b'pHYs', struct.pack('>IIB', PIXELS_PER_METER, PIXELS_PER_METER, 1)),
+        _chunk(b'IDAT', zlib.compress(raw, compression)),
+        _chunk(b'IEND', b''),
+    ])
+
+
+def writePng(fileName, data, width, height, compression=6, pixelFormat='rgba8888', premultiplied=False,
+             dither=False):
+    png = encodePng(data, width, height, compression, pixelFormat, premultiplied, dither)
+    with open(fileName, 'wb') as outfile:
+        outfile.write(png)
+    return len(png)
+
+
+class PngStream(object):
+    # Writes a PNG whose pixels arrive in strips of whole rows, top to bottom.
+    # Every strip is converted and compressed as it arrives, so only one strip
+    # is held in memory. palette is the finished Palette of an indexed image
+    # (every strip is added to it beforehand, the palette precedes the pixels
+    # in the file). The pixels are the ones encodePng writes
+
+    def __init__(self, fileName, width, height, compression=6, pixelFormat='rgba8888', premultiplied=False,
+                 palette=None, dither=False):
+        self.fileName = fileName
+        self.width = width
+        self.pixelFormat = pixelFormat
+        self.premultiplied = premultiplied
+        self.dither = dither
+        self.compressor = zlib.compressobj(compression)
+        self.filterTypes = filterTypes(compression)
+        self.palette = palette
+        self.rows = 0
+        # Last row of the previous strip, the Up, Average and Paeth filters refer to it
+        self.prior = None
+        self.written = 0
+        self.outfile = open(fileName, 'wb')
+
+        if palette is not None:
+            chunks = _paletteChunks(width, height, palette.colors)
+        else:
+            chunks = [_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))]
+        self._write(b''.join([PNG_SIGNATURE] + chunks + [
+            _chunk(b'pHYs', struct.pack('>IIB', PIXELS_PER_METER, PIXELS_PER_METER, 1))]))
+
+    def write(self, data, height):
+        # data is height rows of BGRA pixels
+        rgba = convert(data, self.width, height, self.pixelFormat, self.premultiplied, self.dither, self.rows)
+        self.rows += height
+        if self.palette is not None:
+            raw = _scanlines(memoryview(self.palette.index(rgba)), self.width, height)
+        else:
+            raw = _scanlines(memoryview(rgba), self.width * 4, height, 4, self.prior, self.filterTypes)
+            self.prior = rgba[-self.width * 4:]
+        self._writeData(self.compressor.compress(raw))
+
+    def close(self):
+        # Returns the number of bytes written
+        self._writeData(self.compressor.flush())
+        self._write(_chunk(b'IEND', b''))
+        self.outfile.close()
+        return self.written
+
+    def discard(self):
+        self.outfile.close()
+        os.remove(self.fileName)
+
+    def _writeData(self, compressed):
+        if compressed:
+            self._write(_chunk(b'IDAT', compressed))
+
+    def _write(self, data):
+        self.outfile.write(data)
+        self.written += len(data)
+
+
+class Palette(object):
+    # Median cut quantiser of indexed images. All pixels are added first, then
+    # finish() picks at most 256 colors and index() maps pixels to them.
+    # Images with 256 colors or fewer keep their exact colors. Others are
+    # counted with 5 bits per channel, fully transparent colors share one
+    # entry and the rest is cut into boxes, each becomes the weighted mean
+    # of its colors
+
+    def __init__(self):
+        self.counts = Counter()
+        self.reduced = False
+        self.colors = None
+        self.indexes = None
+
+    def add(self, rgba):
+        offset = 0
+        if not self.reduced:
+            pixels = array('I')
+            pixels.frombytes(rgba)
+            # Counted in blocks to switch to 5 bits early on images with many colors
+            while offset < len(pixels) and len(self.counts) <= 256:
+                self.counts.update(pixels[offset:offset + 65536])
+                offset += 65536
+            if len(self.counts) <= 256:
+                return
+            self.reduced = True
+            counts = Counter()
+            for color, count in self.counts.items():
+                counts[color & _5BIT_MASK] += count
+            self.counts = counts
+        pixels = array('I')
+        pixels.frombytes(rgba[offset * 4:].translate(_TO_5BIT))
+        self.counts.update(pixels)
+
+    def finish(self):
+        if not self.reduced:
+            keys = sorted(self.counts)
+            raw = array('I', keys).tobytes()
+            self.colors = [raw[offset:offset + 4] for offset in range(0, len(raw), 4)]
+            self.indexes = dict((key, index) for index, key in enumerate(keys))
+            self.counts = None
+            return
+
+        keys = list(self.counts)
+        raw = array('I', keys).tobytes()
+        self.indexes = {}
+        self.colors = []
+        colors = []
+        for key, offset in zip(keys, range(0, len(raw), 4)):
+            if raw[offset + 3]:
+                color = raw[offset:offset + 4].translate(_FROM_5BIT)
+                colors.append((color[0], color[1], color[2], color[3], self.counts[key], key))
+            else:
+                self.indexes[key] = 0
+        if self.indexes:
+            self.colors.append(bytes(4))
+        for box in _medianCut(colors, 256 - len(self.colors)):
+            index = len(self.colors)
+            total = sum(color[4] for color in box)
+            self.colors.append(bytes((sum(color[channel] * color[4] for color in box) + total // 2) // total
+                                     for channel in range(4)))
+            for color in box:
+                self.indexes[color[5]] = index
+        self.counts = None
+
+    def index(self, rgba):
+        # Palette indexes of the RGBA pixels, every color was added before
+        pixels = array('I')
+        pixels.frombytes(rgba.translate(_TO_5BIT) if self.reduced else rgba)
+        return bytes(map(self.indexes.__getitem__, pixels))
+
+
+def _medianCut(colors, count):
+    # Splits the (r, g, b, a, pixels, key) colors into at most count boxes.
+    # The box whose widest channel spans the most pixels is split at the
+    # pixel weighted median of that channel
+    boxes = [_box(colors)] if colors else []
+    while len(boxes) < count:
+        position = max(range(len(boxes)), key=lambda index: boxes[index][0])
+        size, channel, box = boxes[position]
+        if not size:
+            break
+        box.sort(key=itemgetter(channel))
+        half = sum(map(itemgetter(4), box)) / 2
+        total = 0
+        for split, color in enumerate(box[:-1], 1):
+            total += color[4]
+            if total >= half:
+                break
+        boxes[position:position + 1] = [_box(box[:split]), _box(box[split:])]
+    return [box for size, channel, box in boxes]
+
+
+def _box(colors):
+    # (widest channel range * pixels, widest channel, colors)
+    ranges = [max(map(itemgetter(channel), colors)) - min(map(itemgetter(channel), colors))
+              for channel in range(4)]
+    channel = ranges.index(max(ranges))
+    return ranges[channel] * sum(map(itemgetter(4), colors)), channel, colors
+
+
+def filterTypes(compression):
+    # Sets of PNG row filters per compression level, every row gets the
+    # filter of a set with the smallest sum of absolute differences, like
+    # libpng. With several sets the one whose rows compress best at level 1
+    # is written. fast only uses Up, smallest also tries Average and Paeth,
+    # which take the most time
+    if compression <= 1:
+        return [(2,)]
+    if compression < 9:
+        return [(0, 1, 2)]
+    return [(2,), (0, 1, 2), (0, 1, 2, 3), (0, 1, 2, 3, 4)]
+
+
+def _scanlines(data, stride, height, bpp=0, prior=None, types=((0, 1, 2),)):
+    # Every scanline is prefixed with its filter type. With bpp 0 (palette
+    # images) rows are not filtered, otherwise types are the filterTypes.
+    # prior is the last row of the previous strip
+    if not bpp:
+        return _prefixRows(data, stride, height, 0)
+
+    size = stride * height
+    data = bytes(data)
+    up = bytes(prior or bytes(stride)) + data[:size - stride]
+    left = bytearray(bpp) + data[:size - bpp]
+    upLeft = bytearray(bpp) + up[:size - bpp]
+    for offset in range(bpp):
+        left[offset::stride] = bytes(height)
+        upLeft[offset::stride] = bytes(height)
+
+    high = _lanes(b'\x80', size)
+    low = _lanes(b'\x7f', size)
+    x, a, b = (int.from_bytes(value, 'little') for value in (data, left, up))
+    filtered = {}
+    for filterType in sorted(set().union(*types)):
+        if filterType == 0:
+            filtered[filterType] = data
+            continue
+        if filterType == 1:
+            predictor = a
+        elif filterType == 2:
+            predictor = b
+        elif filterType == 3:
+            predictor = (a & b) + (((a ^ b) & _lanes(b'\xfe', size)) >> 1)
+        else:
+            predictor = int.from_bytes(_paeth(left, up, upLeft, size), 'little')
+        filtered[filterType] = _subtract(x, predictor, high, low).to_bytes(size, 'little')
+
+    # Costs are summed over every third byte, which samples all channels
+    distances = dict((filterType, candidate.translate(_DISTANCE)) for filterType, candidate in filtered.items())
+    candidates = [_chooseRows(filtered, distances, stride, size, filterSet) for filterSet in types]
+    if len(candidates) == 1:
+        return candidates[0]
+    return min(candidates, key=lambda raw: len(zlib.compress(raw, 1)))
+
+
+def _chooseRows(filtered, distances, stride, size, filterSet):
+    if len(filterSet) == 1:
+        return _prefixRows(filtered[filterSet[0]], stride, size // stride, filterSet[0])
+    raw = bytearray()
+    for offset in range(0, size, stride):
+        costs = [sum(distances[filterType][offset:offset + stride:3]) for filterType in filterSet]
+        filterType = filterSet[costs.index(min(costs))]
+        raw.append(filterType)
+        raw += filtered[filterType][offset:offset + stride]
+    return bytes(raw)
+
+
+def _prefixRows(data, stride, height, filterType):
+    rows = [data[offset:offset + stride] for offset in range(0, stride * height, stride)]
+    prefix = bytes((filterType,))
+    return prefix + prefix.join(rows)
+
+
+def _lanes(pattern, count):
+    # pattern repeated count times as one little endian integer
+    return int.from_bytes(pattern * count, 'little')
+
+
+def _subtract(x, y, high, low):
+    # x - y modulo 256 in every byte, without borrowing from the next byte
+    return ((x | high) - (y & low)) ^ ((x ^ y ^ high) & high)
+
+
+def _paeth(left, up, upLeft, size):
+    # Paeth predictor of every byte, computed in 16 bit lanes holding the
+    # differences biased by 1024 so they stay positive
+    ones = _lanes(b'\x01\x00', size)
+    mask = ones * 0xffff
+    bias = ones << 10
+    a, b, c = (int.from_bytes(_widen(value), 'little') for value in (left, up, upLeft))
+    leftDelta = a + bias - c
+    upDelta = b + bias - c
+    pa = _absolute(upDelta, ones, bias)
+    pb = _absolute(leftDelta, ones, bias)
+    pc = _absolute(leftDelta + upDelta - bias, ones, bias)
+    selectA = _lessEqual(pa, pb, ones) & _lessEqual(pa, pc, ones)
+    selectB = (mask ^ selectA) & _lessEqual(pb, pc, ones)
+    selectC = mask ^ (selectA | selectB)
+    predictor = (a & selectA) | (b & selectB) | (c & selectC)
+    return predictor.to_bytes(size * 2, 'little')[0::2]
+
+
+def _widen(data):
+    wide = bytearray(len(data) * 2)
+    wide[0::2] = data
+    return wide
+
+
+def _absolute(value, ones, bias):
+    # |lane - 1024| of lanes holding 514 to 1534. Flipping the bias bit gives
+    # the difference as 11 bit two's complement, negative ones are negated
+    value ^= bias
+    negative = (value >> 10) & ones
+    return (value ^ (negative * 0x7ff)) + negative
+
+
+def _lessEqual(x, y, ones):
+    # 0xffff in the lanes where x <= y, both below 0x8000
+    return ((((y | (ones << 15)) - x) >> 15) & ones) * 0xffff
+
+
+def _paletteChunks(width, height, colors):
+    # Header of an 8 bit indexed image with the RGBA color bytes as palette
+    return [
+        _chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        _chunk(b'PLTE', b''.join(bytes(color[:3]) for color in colors)),
+        _chunk(b'tRNS', bytes(color[3] for color in colors)),
+    ]
+
+
+def _chunk(tag, payload):
+    crc = zlib.crc32(payload, zlib.crc32(tag))
+    return struct.pack('>I', len(payload)) + tag + payload + struct.pack('>I', crc)
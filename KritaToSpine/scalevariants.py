@@ -0,0 +1,113 @@
+# Scale variants (@1x, @0.5x, @0.25x) written by the same export
+# Layers are read once, each smaller tier is box filtered from the next larger
+# one by halving it. Halving averages the 2x2 blocks of all channels at once:
+# the four pixels of every block are spread into 16 bit lanes of big integers,
+# so adding and dividing them runs in C instead of once per pixel. Channels
+# are averaged unweighted, like a box filter on straight alpha.
+
+import math
+from array import array
+
+
+class ScaleTier(object):
+    # Output folder and the per folder state of one scale factor
+
+    def __init__(self, scale, directory):
+        self.scale = scale
+        self.directory = directory
+        self.cache = None
+        self.atlasImages = {}
+        self.atlasSpool = None
+        # Skeleton of the earlier export a partial export is merged into
+        self.previous = None
+
+
+def tierName(scale):
+    return '@{0:g}x'.format(scale)
+
+
+def halvings(scale):
+    # Number of times an image is halved for scale, None for other factors
+    if scale <= 0 or scale > 1:
+        return None
+    count = int(round(-math.log(scale, 2)))
+    return count if 2.0 ** -count == scale else None
+
+
+def scaledSize(size, scale):
+    for index in range(halvings(scale)):
+        size = (size + 1) // 2
+    return size
+
+
+def variants(data, width, height, scales):
+    # Yields (scale, data, width, height) for scales, largest first. Every
+    # variant is halved from the previous one rather than from the original
+    count = 0
+    for scale in sorted(scales, reverse=True):
+        for index in range(halvings(scale) - count):
+            data, width, height = halve(data, width, height)
+        count = halvings(scale)
+        yield scale, data, width, height
+
+
+def halve(data, width, height):
+    # BGRA pixels to half the size, odd sizes repeat their last column or row
+    rowBytes = width * 4
+    if width % 2:
+        data = b''.join(data[start:start + rowBytes] + data[start + rowBytes - 4:start + rowBytes]
+                        for start in range(0, len(data), rowBytes))
+        width += 1
+        rowBytes += 4
+    if height % 2:
+        data = bytes(data) + data[len(data) - rowBytes:]
+        height += 1
+
+    pixels = array('I')
+    pixels.frombytes(data)
+    halfBytes = rowBytes // 2
+    blocks = []
+    for column in (pixels[0::2].tobytes(), pixels[1::2].tobytes()):
+        for first in (0, 1):
+            blocks.append(b''.join(column[row * halfBytes:(row + 1) * halfBytes]
+                                   for row in range(first, height, 2)))
+
+    count = len(blocks[0])
+    total = sum(_lanes(block) for block in blocks) + int.from_bytes(b'\x00\x02' * count, 'big')
+    mask = int.from_bytes(b'\x00\xff' * count, 'big')
+    averaged = ((total >> 2) & mask).to_bytes(count * 2, 'big')[1::2]
+    return averaged, width // 2, height // 2
+
+
+def _lanes(data):
+    # One byte per 16 bit lane, so sums of four bytes can not carry into the next lane
+    spread = bytearray(len(data) * 2)
+    spread[1::2] = data
+    return int.from_bytes(spread, 'big')
+
+
+def scaleSkeleton(skeleton, scale, images):
+    # Copy of the spine.json model for a tier: positions are scaled, attachment
+    # sizes are the sizes of the halved images
+    result = dict(skeleton)
+    result['skeleton'] = dict(skeleton['skeleton'], images=images)
+    result['bones'] = [_scalePosition(bone, scale) for bone in skeleton['bones']]
+    result['skins'] = {}
+    for skinName, skin in skeleton['skins'].items():
+        result['skins'][skinName] = {}
+        for slotName, attachments in skin.items():
+            scaled = result['skins'][skinName][slotName] = {}
+            for name, attachment in attachments.items():
+                attachment = _scalePosition(attachment, scale)
+                attachment['width'] = scaledSize(attachment['width'], scale)
+                attachment['height'] = scaledSize(attachment['height'], scale)
+                scaled[name] = attachment
+    return result
+
+
+def _scalePosition(item, scale):
+    item = dict(item)
+    for key in ('x', 'y'):
+        if key in item:
+            item[key] = item[key] * scale
+    return item
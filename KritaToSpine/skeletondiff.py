@@ -0,0 +1,105 @@
+# Changes between two exports of a skeleton, written as spine.diff.json
+# Both skeletons are indexed once by bone, slot and skin/slot/attachment name,
+# every lookup after that is a dict access, so the report stays linear in the
+# size of the skeleton. The new skeleton is also checked for duplicate names
+# and parents that do not exist.
+
+BONE_KEYS = ('parent', 'x', 'y', 'rotation', 'scaleX', 'scaleY', 'length')
+SLOT_KEYS = ('bone', 'attachment')
+ATTACHMENT_KEYS = ('x', 'y', 'rotation', 'width', 'height', 'path')
+
+
+def diffSkeletons(previous, current, tolerance=1e-6):
+    # previous is None for the first export. Numbers closer than tolerance
+    # count as equal, spine.json may have been written with rounded floats
+    previous = previous or {}
+    warnings = []
+    report = {
+        'bones': _diff(_index(previous.get('bones', [])), _index(current['bones'], 'bone', warnings),
+                       BONE_KEYS, tolerance),
+        'slots': _diff(_index(previous.get('slots', [])), _index(current['slots'], 'slot', warnings),
+                       SLOT_KEYS, tolerance),
+        'attachments': _diff(_attachments(previous), _attachments(current), ATTACHMENT_KEYS, tolerance),
+        'warnings': warnings,
+    }
+    _checkParents(current, warnings)
+    return report
+
+
+def counts(report):
+    # {'bones': (added, removed, moved), ...} of a diffSkeletons report
+    return dict((kind, tuple(len(report[kind][change]) for change in ('added', 'removed', 'moved')))
+                for kind in ('bones', 'slots', 'attachments'))
+
+
+def _index(items, kind=None, warnings=None):
+    index = {}
+    for item in items:
+        name = item['name']
+        if name in index and warnings is not None:
+            warnings.append(_warning('duplicate' + kind.capitalize(), name,
+                                     "{0} {1} is defined more than once".format(kind.capitalize(), name)))
+        index.setdefault(name, item)
+    return index
+
+
+def _attachments(skeleton):
+    # Attachments keyed by 'skin/slot/attachment'
+    index = {}
+    for skinName, skin in skeleton.get('skins', {}).items():
+        for slotName, attachments in skin.items():
+            for name, attachment in attachments.items():
+                index['{0}/{1}/{2}'.format(skinName, slotName, name)] = attachment
+    return index
+
+
+def _diff(previous, current, keys, tolerance):
+    added = [name for name in current if name not in previous]
+    removed = [name for name in previous if name not in current]
+    moved = []
+    for name, item in current.items():
+        old = previous.get(name)
+        if old is None:
+            continue
+        changed = [key for key in keys if not _same(old.get(key), item.get(key), tolerance)]
+        if changed:
+            moved.append({
+                'name': name,
+                'from': dict((key, old.get(key)) for key in changed),
+                'to': dict((key, item.get(key)) for key in changed),
+            })
+    return {'added': added, 'removed': removed, 'moved': moved}
+
+
+def _same(first, second, tolerance):
+    if isinstance(first, (int, float)) and isinstance(second, (int, float)):
+        return abs(first - second) <= tolerance
+    return first == second
+
+
+def _checkParents(skeleton, warnings):
+    # Bones must follow their parent, slots and skins must point to existing bones and slots
+    bones = set()
+    for bone in skeleton['bones']:
+        parent = bone.get('parent')
+        if parent is not None and parent not in bones:
+            warnings.append(_warning('orphanBone', bone['name'],
+                                     "Bone {0} has no parent bone {1} before it".format(bone['name'], parent)))
+        bones.add(bone['name'])
+
+    slots = set()
+    for slot in skeleton['slots']:
+        if slot['bone'] not in bones:
+            warnings.append(_warning('orphanSlot', slot['name'],
+                                     "Slot {0} is on the missing bone {1}".format(slot['name'], slot['bone'])))
+        slots.add(slot['name'])
+
+    for skinName, skin in skeleton.get('skins', {}).items():
+        for slotName in skin:
+            if slotName not in slots:
+                warnings.append(_warning('orphanAttachments', '{0}/{1}'.format(skinName, slotName),
+                                         "Skin {0} has attachments for the missing slot {1}".format(skinName, slotName)))
+
+
+def _warning(kind, name, message):
+    return {'type': kind, 'name': name, 'message': message}
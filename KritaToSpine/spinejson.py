@@ -0,0 +1,140 @@
+import json
+from json.encoder import encode_basestring_ascii
+
+INFINITY = float('inf')
+
+
+def toSpine38(skeleton):
+    # The exporter keeps skins as {name: {slot: attachments}}, Spine 3.8 JSON
+    # lists them as [{'name': name, 'attachments': {slot: attachments}}].
+    # Used for spine.json written next to spine.skel
+    result = dict(skeleton)
+    result['skins'] = [{'name': name, 'attachments': attachments}
+                       for name, attachments in skeleton['skins'].items()]
+    return result
+
+
+def fromSpine38(skeleton):
+    # Inverse of toSpine38, files written before 3.8 skins are returned as they are
+    skins = skeleton.get('skins')
+    if isinstance(skins, list):
+        skeleton = dict(skeleton)
+        skeleton['skins'] = dict((skin['name'], skin.get('attachments', {})) for skin in skins)
+    return skeleton
+
+
+class SpineJsonWriter(object):
+    # Writes the skeleton one section entry at a time instead of running
+    # json.dump over the whole document. With indent=2 the output is byte
+    # identical to json.dump(skeleton, indent=2); indent=None writes compact
+    # JSON with json's C encoder. precision rounds floats to that many
+    # decimals, integral values are then written without a fraction
+
+    def __init__(self, outfile, indent=2, precision=None):
+        self.outfile = outfile
+        self.indent = indent
+        self.precision = precision
+        self.sections = 0
+        if indent is None:
+            self.separators = (',', ':')
+        else:
+            self.separators = (',', ': ')
+        self.encoder = json.JSONEncoder(indent=indent, separators=self.separators)
+
+    def write(self, skeleton):
+        self.begin()
+        for name, value in skeleton.items():
+            self.writeSection(name, value)
+        self.end()
+
+    def begin(self):
+        self.outfile.write('{')
+        self.sections = 0
+
+    def writeSection(self, name, value):
+        if self.sections:
+            self.outfile.write(',')
+        self.sections += 1
+        self._newline(1)
+        self.outfile.write(json.dumps(name) + self.separators[1])
+        # Lists (bones, slots) are streamed per entry, skins per slot
+        streamDepth = 2 if isinstance(value, dict) else 1
+        if name == 'skins' and isinstance(value, list):
+            streamDepth = 3
+        self._writeValue(value, 1, streamDepth)
+
+    def end(self):
+        if self.sections:
+            self._newline(0)
+        self.outfile.write('}')
+
+    def _writeValue(self, value, level, streamDepth):
+        if streamDepth and isinstance(value, (list, dict)) and value:
+            isDict = isinstance(value, dict)
+            self.outfile.write('{' if isDict else '[')
+            items = value.items() if isDict else value
+            first = True
+            for item in items:
+                if not first:
+                    self.outfile.write(',')
+                first = False
+                self._newline(level + 1)
+                if isDict:
+                    key, item = item
+                    self.outfile.write(json.dumps(key) + self.separators[1])
+                self._writeValue(item, level + 1, streamDepth - 1)
+            self._newline(level)
+            self.outfile.write('}' if isDict else ']')
+            return
+
+        if self.indent is None:
+            self.outfile.write(self.encoder.encode(self._round(value)))
+        else:
+            self.outfile.write(self._format(value, ' ' * (self.indent * level)))
+
+    def _newline(self, level):
+        if self.indent is not None:
+            self.outfile.write('\n' + ' ' * (self.indent * level))
+
+    def _format(self, value, prefix):
+        # Indented encoding in the layout of json.dump, without the overhead
+        # of json's generator based pure Python encoder
+        if isinstance(value, str):
+            return encode_basestring_ascii(value)
+        if value is None:
+            return 'null'
+        if value is True:
+            return 'true'
+        if value is False:
+            return 'false'
+        if isinstance(value, float):
+            value = self._round(value)
+            if value != value or value in (INFINITY, -INFINITY):
+                return self.encoder.encode(value)
+            return repr(value)
+        if isinstance(value, int):
+            return int.__repr__(value)
+
+        inner = prefix + ' ' * self.indent
+        if isinstance(value, dict):
+            if not value:
+                return '{}'
+            items = [inner + encode_basestring_ascii(key) + ': ' + self._format(item, inner)
+                     for key, item in value.items()]
+            return '{\n' + ',\n'.join(items) + '\n' + prefix + '}'
+        if not value:
+            return '[]'
+        items = [inner + self._format(item, inner) for item in value]
+        return '[\n' + ',\n'.join(items) + '\n' + prefix + ']'
+
+    def _round(self, value):
+        if self.precision is None:
+            return value
+        if isinstance(value, float):
+            rounded = round(value, self.precision)
+            return int(rounded) if rounded.is_integer() else rounded
+        if isinstance(value, dict):
+            return dict((key, self._round(item)) for key, item in value.items())
+        if isinstance(value, list):
+            return [self._round(item) for item in value]
+        return value
@@ -0,0 +1,295 @@
+# Spine binary skeleton (.skel) writer and reader
+# Uses the Spine 3.8 binary layout, a spine.json written next to it uses the
+# 3.8 JSON layout as well (spinejson.toSpine38). Only what the exporter produces is
+# supported: bones, slots and region attachments in one or more skins, no
+# constraints, events or animations. readSkeleton decodes a file back into the JSON model so both
+# outputs can be compared.
+
+import struct
+
+SPINE_VERSION = '3.8.99'
+DEFAULT_BONE_COLOR = 0x989898ff
+WHITE = 0xffffffff
+NO_COLOR = 0xffffffff
+ATTACHMENT_REGION = 0
+
+
+class SkelWriter(object):
+
+    def __init__(self):
+        self.data = bytearray()
+        self.strings = []
+        self.stringIndex = {}
+
+    def writeByte(self, value):
+        self.data.append(value & 0xff)
+
+    def writeBoolean(self, value):
+        self.writeByte(1 if value else 0)
+
+    def writeInt(self, value):
+        self.data += struct.pack('>I', value & 0xffffffff)
+
+    def writeVarint(self, value):
+        # Variable length, 7 bits per byte, for values that are usually small and positive
+        value &= 0xffffffff
+        while value > 0x7f:
+            self.data.append((value & 0x7f) | 0x80)
+            value >>= 7
+        self.data.append(value)
+
+    def writeFloat(self, value):
+        self.data += struct.pack('>f', value)
+
+    def writeString(self, value):
+        if value is None:
+            self.writeVarint(0)
+            return
+        encoded = value.encode('utf-8')
+        self.writeVarint(len(encoded) + 1)
+        self.data += encoded
+
+    def writeStringRef(self, value):
+        # Index into the string table, 0 is null
+        if value is None:
+            self.writeVarint(0)
+            return
+        self.writeVarint(self.ref(value))
+
+    def ref(self, value):
+        index = self.stringIndex.get(value)
+        if index is None:
+            self.strings.append(value)
+            index = self.stringIndex[value] = len(self.strings)
+        return index
+
+
+class SkelReader(object):
+
+    def __init__(self, data):
+        self.data = data
+        self.position = 0
+        self.strings = []
+
+    def readByte(self):
+        value = self.data[self.position]
+        self.position += 1
+        return value
+
+    def readBoolean(self):
+        return self.readByte() != 0
+
+    def readInt(self):
+        value, = struct.unpack_from('>I', self.data, self.position)
+        self.position += 4
+        return value
+
+    def readVarint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.readByte()
+            value |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return value
+            shift += 7
+
+    def readFloat(self):
+        value, = struct.unpack_from('>f', self.data, self.position)
+        self.position += 4
+        return value
+
+    def readString(self):
+        length = self.readVarint()
+        if length == 0:
+            return None
+        length -= 1
+        value = bytes(self.data[self.position:self.position + length]).decode('utf-8')
+        self.position += length
+        return value
+
+    def readStringRef(self):
+        index = self.readVarint()
+        return self.strings[index - 1] if index else None
+
+
+def writeSkeleton(fileName, skeleton):
+    with open(fileName, 'wb') as outfile:
+        outfile.write(encodeSkeleton(skeleton))
+
+
+def encodeSkeleton(skeleton):
+    # skeleton is the model written to spine.json
+    bones = skeleton['bones']
+    slots = skeleton['slots']
+    skins = skeleton['skins']
+    boneIndex = dict((bone['name'], index) for index, bone in enumerate(bones))
+    slotIndex = dict((slot['name'], index) for index, slot in enumerate(slots))
+
+    # The string table has to precede its users, so the body is written first
+    body = SkelWriter()
+
+    body.writeVarint(len(bones))
+    for index, bone in enumerate(bones):
+        body.writeString(bone['name'])
+        if index:
+            body.writeVarint(boneIndex[bone['parent']])
+        body.writeFloat(bone.get('rotation', 0))
+        body.writeFloat(bone.get('x', 0))
+        body.writeFloat(bone.get('y', 0))
+        body.writeFloat(bone.get('scaleX', 1))
+        body.writeFloat(bone.get('scaleY', 1))
+        body.writeFloat(bone.get('shearX', 0))
+        body.writeFloat(bone.get('shearY', 0))
+        body.writeFloat(bone.get('length', 0))
+        body.writeVarint(0)  # transform mode: normal
+        body.writeBoolean(False)  # skin required
+        body.writeInt(DEFAULT_BONE_COLOR)
+
+    body.writeVarint(len(slots))
+    for slot in slots:
+        body.writeString(slot['name'])
+        body.writeVarint(boneIndex[slot['bone']])
+        body.writeInt(WHITE)
+        body.writeInt(NO_COLOR)  # dark color
+        body.writeStringRef(slot.get('attachment'))
+        body.writeVarint(0)  # blend mode: normal
+
+    # IK, transform and path constraints
+    body.writeVarint(0)
+    body.writeVarint(0)
+    body.writeVarint(0)
+
+    defaultSkin = skins.get('default', {})
+    _writeSkinAttachments(body, defaultSkin, slotIndex)
+    otherSkins = [(name, skin) for name, skin in skins.items() if name != 'default']
+    body.writeVarint(len(otherSkins))
+    for name, skin in otherSkins:
+        body.writeStringRef(name)
+        # Bones and constraints that are only active in this skin
+        for count in range(4):
+            body.writeVarint(0)
+        _writeSkinAttachments(body, skin, slotIndex)
+
+    body.writeVarint(0)  # events
+    body.writeVarint(0)  # animations
+
+    header = SkelWriter()
+    header.writeString('')  # hash
+    header.writeString(SPINE_VERSION)
+    for value in range(4):
+        header.writeFloat(0)  # x, y, width, height
+    header.writeBoolean(True)  # nonessential data: fps, images and bone colors
+    header.writeFloat(30)
+    header.writeString(skeleton.get('skeleton', {}).get('images'))
+    header.writeString(None)  # audio
+    header.writeVarint(len(body.strings))
+    for value in body.strings:
+        header.writeString(value)
+
+    return bytes(header.data + body.data)
+
+
+def _writeSkinAttachments(writer, skin, slotIndex):
+    writer.writeVarint(len(skin))
+    for slotName, attachments in skin.items():
+        writer.writeVarint(slotIndex[slotName])
+        writer.writeVarint(len(attachments))
+        for name, attachment in attachments.items():
+            writer.writeStringRef(name)
+            writer.writeStringRef(None)  # attachment name is the key
+            writer.writeByte(ATTACHMENT_REGION)
+            writer.writeStringRef(attachment.get('path'))
+            writer.writeFloat(attachment.get('rotation', 0))
+            writer.writeFloat(attachment.get('x', 0))
+            writer.writeFloat(attachment.get('y', 0))
+            writer.writeFloat(attachment.get('scaleX', 1))
+            writer.writeFloat(attachment.get('scaleY', 1))
+            writer.writeFloat(attachment['width'])
+            writer.writeFloat(attachment['height'])
+            writer.writeInt(WHITE)
+
+
+def readSkeleton(data):
+    # Decodes a .skel written by encodeSkeleton into the spine.json model
+    reader = SkelReader(data)
+    reader.readString()  # hash
+    version = reader.readString()
+    for value in range(4):
+        reader.readFloat()
+    nonessential = reader.readBoolean()
+    images = None
+    if nonessential:
+        reader.readFloat()  # fps
+        images = reader.readString()
+        reader.readString()  # audio
+    reader.strings = [reader.readString() for index in range(reader.readVarint())]
+
+    bones = []
+    for index in range(reader.readVarint()):
+        bone = {'name': reader.readString()}
+        if index:
+            bone['parent'] = bones[reader.readVarint()]['name']
+        rotation, x, y, scaleX, scaleY, shearX, shearY, length = [reader.readFloat() for value in range(8)]
+        if index or x or y:
+            bone['x'] = x
+            bone['y'] = y
+        for key, value, default in (('rotation', rotation, 0), ('scaleX', scaleX, 1), ('scaleY', scaleY, 1),
+                                    ('shearX', shearX, 0), ('shearY', shearY, 0), ('length', length, 0)):
+            if value != default:
+                bone[key] = value
+        reader.readVarint()  # transform mode
+        reader.readBoolean()  # skin required
+        if nonessential:
+            reader.readInt()  # color
+        bones.append(bone)
+
+    slots = []
+    for index in range(reader.readVarint()):
+        name = reader.readString()
+        bone = bones[reader.readVarint()]['name']
+        reader.readInt()  # color
+        reader.readInt()  # dark color
+        slots.append({'name': name, 'bone': bone, 'attachment': reader.readStringRef()})
+        reader.readVarint()  # blend mode
+
+    for constraints in range(3):
+        if reader.readVarint():
+            raise ValueError("Constraints are not supported")
+
+    skins = {'default': _readSkinAttachments(reader, slots)}
+    for index in range(reader.readVarint()):
+        name = reader.readStringRef()
+        for count in range(4):
+            for item in range(reader.readVarint()):
+                reader.readVarint()
+        skins[name] = _readSkinAttachments(reader, slots)
+
+    skeleton = {'skeleton': {'spine': version}, 'bones': bones, 'slots': slots, 'skins': skins, 'animations': {}}
+    if images is not None:
+        skeleton['skeleton']['images'] = images
+    return skeleton
+
+
+def _readSkinAttachments(reader, slots):
+    skin = {}
+    for slot in range(reader.readVarint()):
+        attachments = skin.setdefault(slots[reader.readVarint()]['name'], {})
+        for index in range(reader.readVarint()):
+            key = reader.readStringRef()
+            name = reader.readStringRef() or key
+            if reader.readByte() != ATTACHMENT_REGION:
+                raise ValueError("Only region attachments are supported")
+            path = reader.readStringRef()
+            rotation, x, y, scaleX, scaleY, width, height = [reader.readFloat() for value in range(7)]
+            reader.readInt()  # color
+
+            attachment = {'x': x, 'y': y, 'rotation': rotation, 'width': width, 'height': height}
+            if scaleX != 1:
+                attachment['scaleX'] = scaleX
+            if scaleY != 1:
+                attachment['scaleY'] = scaleY
+            if path is not None:
+                attachment['path'] = path
+            attachments[name] = attachment
+    return skin
@@ -1,3 +1,8 @@
 ToolClasses = ['scaletool.scaletool.ScaleTool',
                'canvassizetool.canvassizetool.CanvasSizeTool',
                'rotatetool.rotatetool.RotateTool']
+
+# Tab titles, so a tab can be added before its tool is imported and built
+ToolTitles = {'scaletool.scaletool.ScaleTool': 'Scale',
+              'canvassizetool.canvassizetool.CanvasSizeTool': 'Canvas Size',
+              'rotatetool.rotatetool.RotateTool': 'Rotate'}
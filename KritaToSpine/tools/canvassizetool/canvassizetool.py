@@ -47,11 +47,31 @@ class CanvasSizeTool(QWidget):
         self.layout.addRow(i18n("Height:"), self.heightSpinBox)
         self.layout.addRow(i18n("Offset:"), self.offsetLayout)
 
-    def adjust(self, document):
-        document.resizeImage(self.xOffsetSpinBox.value(),
-                             self.yOffsetSpinBox.value(),
-                             self.widthSpinBox.value(),
-                             self.heightSpinBox.value())
+    def settings(self):
+        # Current values, adjust, compose and isIdentity take saved ones instead
+        return {'xOffset': self.xOffsetSpinBox.value(),
+                'yOffset': self.yOffsetSpinBox.value(),
+                'width': self.widthSpinBox.value(),
+                'height': self.heightSpinBox.value()}
+
+    def adjust(self, document, settings=None):
+        settings = settings or self.settings()
+        document.resizeImage(settings['xOffset'],
+                             settings['yOffset'],
+                             settings['width'],
+                             settings['height'])
+
+    def compose(self, transform, document, settings=None):
+        settings = settings or self.settings()
+        transform.resize(settings['xOffset'] - document.xOffset(),
+                         settings['yOffset'] - document.yOffset(),
+                         settings['width'],
+                         settings['height'])
+
+    def isIdentity(self, document, settings=None):
+        settings = settings or self.settings()
+        canvas = (document.xOffset(), document.yOffset(), document.width(), document.height())
+        return (settings['xOffset'], settings['yOffset'], settings['width'], settings['height']) == canvas
 
     def updateFields(self, document):
         self.xOffsetSpinBox.setValue(document.xOffset())
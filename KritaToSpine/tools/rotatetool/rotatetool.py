@@ -37,5 +37,18 @@ class RotateTool(QWidget):
 
         self.layout.addRow(i18n("Degrees:"), self.degreesSpinBox)
 
-    def adjust(self, document):
-        document.rotateImage(math.radians(self.degreesSpinBox.value()))
+    def settings(self):
+        # Current values, adjust, compose and isIdentity take saved ones instead
+        return {'degrees': self.degreesSpinBox.value()}
+
+    def adjust(self, document, settings=None):
+        settings = settings or self.settings()
+        document.rotateImage(math.radians(settings['degrees']))
+
+    def compose(self, transform, document, settings=None):
+        settings = settings or self.settings()
+        transform.rotate(settings['degrees'])
+
+    def isIdentity(self, document, settings=None):
+        settings = settings or self.settings()
+        return settings['degrees'] % 360 == 0
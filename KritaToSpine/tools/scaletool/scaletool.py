@@ -54,12 +54,30 @@ class ScaleTool(QWidget):
         self.layout.addRow(i18n("Resolution:"), self.resolutionLayout)
         self.layout.addRow(i18n("Filter:"), self.strategyComboBox)
 
-    def adjust(self, document):
-        document.scaleImage(self.widthSpinBox.value(),
-                            self.heightSpinBox.value(),
-                            self.xResSpinBox.value(),
-                            self.yResSpinBox.value(),
-                            self.strategyComboBox.currentText())
+    def settings(self):
+        # Current values, adjust, compose and isIdentity take saved ones instead
+        return {'width': self.widthSpinBox.value(),
+                'height': self.heightSpinBox.value(),
+                'xRes': self.xResSpinBox.value(),
+                'yRes': self.yResSpinBox.value(),
+                'strategy': self.strategyComboBox.currentText()}
+
+    def adjust(self, document, settings=None):
+        settings = settings or self.settings()
+        document.scaleImage(settings['width'],
+                            settings['height'],
+                            settings['xRes'],
+                            settings['yRes'],
+                            settings['strategy'])
+
+    def compose(self, transform, document, settings=None):
+        settings = settings or self.settings()
+        transform.scale(settings['width'], settings['height'], settings['strategy'])
+
+    def isIdentity(self, document, settings=None):
+        settings = settings or self.settings()
+        size = (document.width(), document.height())
+        return (settings['width'], settings['height']) == size
 
     def updateFields(self, document):
         self.xResSpinBox.setValue(document.xRes())
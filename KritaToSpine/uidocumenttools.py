@@ -14,19 +14,30 @@
 
 from . import documenttoolsdialog
 from . import SpineExport
+from . import atlaspacker
+from . import documenttransform
+from . import exportprofiler
+from . import layernodes
+from . import pngwriter
 
-from PyQt5.QtCore import Qt, pyqtSignal, QObject
+from PyQt5.QtCore import Qt
 from PyQt5.QtWidgets import (QFormLayout, QListWidget, QAbstractItemView, QLineEdit, QFileDialog,
-                             QDialogButtonBox, QVBoxLayout, QFrame, QTabWidget,
-                             QPushButton, QAbstractScrollArea, QMessageBox, QHBoxLayout)
+                             QDialogButtonBox, QVBoxLayout, QFrame, QTabWidget, QWidget,
+                             QPushButton, QAbstractScrollArea, QMessageBox, QHBoxLayout, QSpinBox,
+                             QCheckBox, QComboBox, QProgressDialog, QApplication)
+from concurrent.futures import ThreadPoolExecutor
+import json
 import os
+import time
 import krita
 import importlib
 
 
 class UIDocumentTools(object):
 
-    def __init__(self):
+    def __init__(self, watcher=None):
+        # exportwatcher.ExportWatcher owned by the extension, None disables watch mode
+        self.watcher = watcher
         self.mainDialog = documenttoolsdialog.DocumentToolsDialog()
         self.spineExport = SpineExport.SpineExport()
         self.mainLayout = QVBoxLayout(self.mainDialog)
@@ -41,9 +52,36 @@ class UIDocumentTools(object):
         self.directorySelectorLayout = QHBoxLayout()
         self.directoryTextField = QLineEdit()
         self.directoryDialogButton = QPushButton(i18n("..."))
+        # Number of threads encoding and writing the images
+        self.workersSpinBox = QSpinBox()
+        # Pixels held at once, larger layers are exported in strips
+        self.memoryBudgetSpinBox = QSpinBox()
+        self.atlasCheckBox = QCheckBox(i18n("Pack images into a texture atlas"))
+        # Largest atlas page, layers must fit on one page
+        self.atlasSizeComboBox = QComboBox()
+        self.trimCheckBox = QCheckBox(i18n("Trim transparent borders"))
+        self.profileCheckBox = QCheckBox(i18n("Write timings to spine.trace.json"))
+        self.compactCheckBox = QCheckBox(i18n("Compact spine.json, round to 2 decimals"))
+        self.formatComboBox = QComboBox()
+        # PNG presets, remembered per document
+        self.presetComboBox = QComboBox()
+        self.pixelFormatComboBox = QComboBox()
+        self.premultipliedCheckBox = QCheckBox(i18n("Premultiply colors by alpha"))
+        self.ditherCheckBox = QCheckBox(i18n("Dither RGBA 4444"))
+        # Scale variants, e.g. "1, 0.5, 0.25" writes @1x, @0.5x and @0.25x folders
+        self.scalesTextField = QLineEdit("1")
+        # Partial export, e.g. "arm, legs (bone)/*" only saves these subtrees
+        self.onlyTextField = QLineEdit()
+        self.onlyTextField.setPlaceholderText(i18n("Bones, slots or layer paths, empty exports everything"))
+        self.watchCheckBox = QCheckBox(i18n("Export again whenever the documents are saved"))
 
         self.kritaInstance = krita.Krita.instance()
         self.documentsList = []
+        # Tool tabs, see loadTools
+        self.toolEntries = []
+        self.initialized = False
+        # Seconds the last initialize() took to show the dialog
+        self.openSeconds = 0.0
 
         self.refreshButton.clicked.connect(self.refreshButtonClicked)
         self.buttonBox.accepted.connect(self.confirmButton)
@@ -52,11 +90,41 @@ class UIDocumentTools(object):
         self.widgetDocuments.clicked.connect(self._documentSelected)
 
         self.mainDialog.setWindowModality(Qt.NonModal)
-        self.widgetDocuments.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.widgetDocuments.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.widgetDocuments.setSizeAdjustPolicy(QAbstractScrollArea.AdjustToContents)
+        self.workersSpinBox.setRange(1, 64)
+        self.workersSpinBox.setValue(self.spineExport.workers)
+        self.memoryBudgetSpinBox.setRange(64, 65536)
+        self.memoryBudgetSpinBox.setSuffix(" MB")
+        self.memoryBudgetSpinBox.setValue(self.spineExport.memoryBudget // 1048576)
+        self.trimCheckBox.setChecked(self.spineExport.trim)
+        self.formatComboBox.addItem(i18n("JSON (spine.json)"), 'json')
+        self.formatComboBox.addItem(i18n("Binary (spine.skel)"), 'skel')
+        self.formatComboBox.addItem(i18n("JSON and binary"), 'both')
+        self.presetComboBox.addItem(i18n("Fast"), 'fast')
+        self.presetComboBox.addItem(i18n("Balanced"), 'balanced')
+        self.presetComboBox.addItem(i18n("Smallest"), 'smallest')
+        self.presetComboBox.setCurrentIndex(self.presetComboBox.findData('balanced'))
+        self.pixelFormatComboBox.addItem(i18n("RGBA 8888"), 'rgba8888')
+        self.pixelFormatComboBox.addItem(i18n("RGBA 4444"), 'rgba4444')
+        self.pixelFormatComboBox.addItem(i18n("Indexed (256 colors)"), 'indexed')
+        for size in (1024, 2048, 4096, 8192):
+            self.atlasSizeComboBox.addItem("{0} x {0}".format(size), size)
+        self.atlasSizeComboBox.setCurrentIndex(self.atlasSizeComboBox.findData(2048))
 
     def initialize(self):
+        # The dialog is built on the first call, later calls only refresh the documents and show it
+        start = time.perf_counter()
+        if not self.initialized:
+            self._build()
+            self.initialized = True
         self.loadDocuments()
+
+        self.mainDialog.show()
+        self.mainDialog.activateWindow()
+        self.openSeconds = time.perf_counter() - start
+
+    def _build(self):
         self.loadTools()
 
         self.documentLayout.addWidget(self.widgetDocuments)
@@ -66,6 +134,22 @@ class UIDocumentTools(object):
 
         self.formLayout.addRow(i18n("Documents:"), self.documentLayout)
         self.formLayout.addRow(i18n("Output Directory:"), self.directorySelectorLayout)
+        self.formLayout.addRow(i18n("Workers:"), self.workersSpinBox)
+        self.formLayout.addRow(i18n("Memory budget:"), self.memoryBudgetSpinBox)
+        self.formLayout.addRow(i18n("Atlas:"), self.atlasCheckBox)
+        self.formLayout.addRow(i18n("Atlas page size:"), self.atlasSizeComboBox)
+        self.formLayout.addRow(i18n("Trim:"), self.trimCheckBox)
+        self.formLayout.addRow(i18n("Format:"), self.formatComboBox)
+        self.formLayout.addRow(i18n("Compression:"), self.presetComboBox)
+        self.formLayout.addRow(i18n("Pixels:"), self.pixelFormatComboBox)
+        self.formLayout.addRow(i18n("Alpha:"), self.premultipliedCheckBox)
+        self.formLayout.addRow(i18n("Dither:"), self.ditherCheckBox)
+        self.formLayout.addRow(i18n("Scales:"), self.scalesTextField)
+        self.formLayout.addRow(i18n("Only:"), self.onlyTextField)
+        self.formLayout.addRow(i18n("JSON:"), self.compactCheckBox)
+        self.formLayout.addRow(i18n("Profile:"), self.profileCheckBox)
+        if self.watcher:
+            self.formLayout.addRow(i18n("Watch:"), self.watchCheckBox)
         self.formLayout.addRow(self.tabTools)
 
         self.line = QFrame()
@@ -79,8 +163,6 @@ class UIDocumentTools(object):
         self.mainDialog.resize(500, 300)
         self.mainDialog.setWindowTitle(i18n("Document Tools"))
         self.mainDialog.setSizeGripEnabled(True)
-        self.mainDialog.show()
-        self.mainDialog.activateWindow()
 
     def loadTools(self):
         modulePath = 'KritaToSpine.tools'
@@ -91,13 +173,31 @@ class UIDocumentTools(object):
             _module = classPath[:classPath.rfind(".")]
             _klass = classPath[classPath.rfind(".") + 1:]
             modules.append(dict(module='{0}.{1}'.format(modulePath, _module),
-                                klass=_klass))
+                                klass=_klass,
+                                title=toolsModule.ToolTitles.get(classPath, _klass)))
 
+        # Tabs start out empty, a tool is imported and built the first time its tab is shown
         for module in modules:
-            m = importlib.import_module(module['module'])
-            toolClass = getattr(m, module['klass'])
-            obj = toolClass(self.mainDialog)
-            self.tabTools.addTab(obj, obj.objectName())
+            page = QWidget()
+            pageLayout = QVBoxLayout(page)
+            pageLayout.setContentsMargins(0, 0, 0, 0)
+            self.toolEntries.append(dict(module, page=page, tool=None))
+            self.tabTools.addTab(page, i18n(module['title']))
+        self.tabTools.currentChanged.connect(self._toolShown)
+        self._toolShown(self.tabTools.currentIndex())
+
+    def _toolShown(self, index):
+        if index < 0 or self.toolEntries[index]['tool'] is not None:
+            return
+        entry = self.toolEntries[index]
+        m = importlib.import_module(entry['module'])
+        toolClass = getattr(m, entry['klass'])
+        entry['tool'] = toolClass(self.mainDialog)
+        entry['page'].layout().addWidget(entry['tool'])
+
+        doc = self._selectedDocuments()
+        if doc and hasattr(entry['tool'], 'updateFields'):
+            entry['tool'].updateFields(doc[0])
 
     def loadDocuments(self):
         self.widgetDocuments.clear()
@@ -118,22 +218,207 @@ class UIDocumentTools(object):
 
         self.msgBox = QMessageBox(self.mainDialog)
 
-        if selectedDocuments:
-            # TODO have this loop through the tabs and apply all of the items
-            widget = self.tabTools.currentWidget()
-            for document in selectedDocuments:
-                cloneDoc = document.clone()
-                widget.adjust(cloneDoc)
-                # Save the json from the clone
-                self.spineExport.exportDocument(cloneDoc, self.directoryTextField.text())
-                # Clone no longer needed
-                cloneDoc.close()
-
-            self.msgBox.setText(i18n("The selected document has been exported."))
+        try:
+            scales = [float(value) for value in self.scalesTextField.text().replace(',', ' ').split()]
+        except ValueError:
+            scales = []
+
+        if selectedDocuments and scales:
+            options = self._exportOptions(scales)
+            self._applyExportOptions(options)
+            self._savePngSettings(selectedDocuments)
+            profiler = exportprofiler.ExportProfiler() if self.profileCheckBox.isChecked() else exportprofiler.NullProfiler()
+            self.spineExport.profiler = profiler
+
+            self.progressDialog = QProgressDialog(i18n("Exporting..."), i18n("Cancel"), 0, len(selectedDocuments), self.mainDialog)
+            # The export reads the documents on the GUI thread and processes events
+            # while it runs, blocking all windows keeps them from being edited or closed
+            self.progressDialog.setWindowModality(Qt.ApplicationModal)
+            self.progressDialog.setMinimumDuration(0)
+            self.spineExport.progress = self._exportProgress
+            # The tabs hold absolute sizes filled in from one document, so
+            # they only apply when a single document is exported
+            toolSettings = self._toolSettings() if len(selectedDocuments) == 1 else []
+            message = []
+            exportedDocuments = []
+            # One pool encodes the images of all documents
+            with ThreadPoolExecutor(max_workers=self.spineExport.workers) as pool:
+                self.spineExport.sharedPool = pool
+                if self.watcher:
+                    self.watcher.paused = True
+                try:
+                    for index, document in enumerate(selectedDocuments):
+                        name = os.path.basename(document.fileName())
+                        self.progressLabel = i18n("Exporting {0} ({1} of {2})").format(name, index + 1, len(selectedDocuments))
+                        self.progressDialog.setLabelText(self.progressLabel)
+                        self.progressDialog.setValue(index)
+                        directory = self._outputDirectory(document, len(selectedDocuments))
+
+                        start = time.perf_counter()
+                        if not self._exportDocument(document, directory, profiler, toolSettings):
+                            # The exporter already showed why
+                            message.append(i18n("{0}: not exported").format(name))
+                            continue
+                        exportedDocuments.append(document)
+                        message.append(i18n("{0}: {1:.2f}s, {2} layers, {3} images written").format(
+                            name, time.perf_counter() - start, self.spineExport.stats['layers'],
+                            self.spineExport.stats['imagesWritten']))
+                        message.extend("  " + line for line in self.spineExport.summary())
+                    if len(exportedDocuments) == len(selectedDocuments):
+                        message.insert(0, i18n("The selected documents have been exported."))
+                    else:
+                        message.insert(0, i18n("{0} of {1} documents have been exported.").format(
+                            len(exportedDocuments), len(selectedDocuments)))
+                    if self.watcher:
+                        self._updateWatch(selectedDocuments, exportedDocuments, options, toolSettings)
+                except SpineExport.ExportCancelled:
+                    message.insert(0, i18n("The export was cancelled."))
+                finally:
+                    if self.watcher:
+                        self.watcher.paused = False
+                    self.spineExport.sharedPool = None
+                    self.spineExport.progress = None
+                    self.progressDialog.close()
+
+            if profiler.enabled:
+                profiler.writeTrace(os.path.join(self.directoryTextField.text(), 'spine.trace.json'))
+
+            self.msgBox.setText("\n".join(message))
+        elif selectedDocuments:
+            self.msgBox.setText(i18n("Enter the scales to export, e.g. 1, 0.5, 0.25."))
         else:
             self.msgBox.setText(i18n("Select at least one document."))
         self.msgBox.exec_()
 
+    def _pngSettings(self):
+        # {document file name: {'preset', 'pixelFormat', 'premultiplied', 'dither'}}
+        try:
+            return json.loads(self.kritaInstance.readSetting('KritaToSpine', 'pngSettings', '{}'))
+        except ValueError:
+            return {}
+
+    def _loadPngSettings(self, document):
+        settings = self._pngSettings().get(document.fileName())
+        if not settings:
+            return
+        for comboBox, value in ((self.presetComboBox, settings.get('preset')),
+                                (self.pixelFormatComboBox, settings.get('pixelFormat'))):
+            index = comboBox.findData(value)
+            if index >= 0:
+                comboBox.setCurrentIndex(index)
+        self.premultipliedCheckBox.setChecked(bool(settings.get('premultiplied')))
+        self.ditherCheckBox.setChecked(bool(settings.get('dither')))
+
+    def _savePngSettings(self, documents):
+        settings = self._pngSettings()
+        for document in documents:
+            settings[document.fileName()] = {
+                'preset': self.presetComboBox.currentData(),
+                'pixelFormat': self.pixelFormatComboBox.currentData(),
+                'premultiplied': self.premultipliedCheckBox.isChecked(),
+                'dither': self.ditherCheckBox.isChecked(),
+            }
+        self.kritaInstance.writeSetting('KritaToSpine', 'pngSettings', json.dumps(settings))
+
+    def _outputDirectory(self, document, count):
+        # Documents get their own folder when several are exported at once
+        directory = self.directoryTextField.text()
+        if count > 1:
+            directory = os.path.join(directory, os.path.splitext(os.path.basename(document.fileName()))[0])
+            os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _exportOptions(self, scales):
+        # The dialog's exporter settings, kept per watched document
+        compact = self.compactCheckBox.isChecked()
+        return {
+            'scales': scales,
+            'workers': self.workersSpinBox.value(),
+            'memoryBudget': self.memoryBudgetSpinBox.value() * 1048576,
+            'atlas': self.atlasCheckBox.isChecked(),
+            'atlasSize': self.atlasSizeComboBox.currentData(),
+            'trim': self.trimCheckBox.isChecked(),
+            'outputFormat': self.formatComboBox.currentData(),
+            'compression': pngwriter.PRESETS[self.presetComboBox.currentData()],
+            'pixelFormat': self.pixelFormatComboBox.currentData(),
+            'premultipliedAlpha': self.premultipliedCheckBox.isChecked(),
+            'dither': self.ditherCheckBox.isChecked(),
+            'partial': [name.strip() for name in self.onlyTextField.text().split(',') if name.strip()],
+            'jsonIndent': None if compact else 2,
+            'jsonPrecision': 2 if compact else None,
+        }
+
+    def _applyExportOptions(self, options):
+        for name, value in options.items():
+            if name not in ('atlas', 'atlasSize'):
+                setattr(self.spineExport, name, value)
+        self.spineExport.atlasPacker = None
+        if options['atlas']:
+            self.spineExport.atlasPacker = atlaspacker.AtlasPacker(options['atlasSize'], options['atlasSize'])
+
+    def _updateWatch(self, documents, exportedDocuments, options, toolSettings):
+        # Documents the exporter refused are not watched. The exporter options
+        # and tool settings of this export are kept for the document, the
+        # dialog may export another document with other settings before it
+        # is saved again
+        for document in documents:
+            if self.watchCheckBox.isChecked() and document in exportedDocuments:
+                self.watcher.watch(document, self._outputDirectory(document, len(documents)),
+                                   lambda document, directory, options=options, toolSettings=toolSettings:
+                                   self._watchExport(document, directory, options, toolSettings))
+            else:
+                self.watcher.unwatch(document)
+
+    def _watchExport(self, document, directory, options, toolSettings):
+        # Called by the watcher after a save, with the settings of the document's last export
+        self._applyExportOptions(options)
+        self.spineExport.profiler = exportprofiler.NullProfiler()
+        self._exportDocument(document, directory, self.spineExport.profiler, toolSettings)
+
+    def _exportDocument(self, document, directory, profiler, toolSettings):
+        # toolSettings are (tool, settings) pairs, tools left at the
+        # document's own settings are skipped
+        toolSettings = [(tool, settings) for tool, settings in toolSettings
+                        if not tool.isIdentity(document, settings)]
+        transform = documenttransform.DocumentTransform(document.width(), document.height())
+        for tool, settings in toolSettings:
+            tool.compose(transform, document, settings)
+
+        # Returns False when the exporter refused the document
+        if transform.isIdentity():
+            # Nothing to transform, export straight from the document without cloning it
+            with profiler.phase('export', 'document'):
+                return self.spineExport.exportDocument(document, directory)
+
+        rgba = document.colorModel() == 'RGBA' and document.colorDepth() == 'U8'
+        if rgba and transform.isBilinear():
+            # Every layer is resampled once, by all tools together, as it is exported
+            with profiler.phase('export', 'document'):
+                return self.spineExport.exportDocument(layernodes.TransformedDocument(document, transform), directory)
+
+        # Other color spaces and scale filters are transformed by Krita, one tool after the other
+        with profiler.phase('clone', 'document'):
+            cloneDoc = document.clone()
+        try:
+            with profiler.phase('adjust', 'document'):
+                for tool, settings in toolSettings:
+                    tool.adjust(cloneDoc, settings)
+            # Save the json from the clone
+            with profiler.phase('export', 'document'):
+                return self.spineExport.exportDocument(cloneDoc, directory)
+        finally:
+            # Clone no longer needed
+            with profiler.phase('close', 'document'):
+                cloneDoc.close()
+
+    def _exportProgress(self, layers, images):
+        self.progressDialog.setLabelText(i18n("{0}\n{1} of {2} layers read, {3} images written").format(
+            self.progressLabel, layers, self.spineExport.layerIndex.imageCount, images))
+        # Keep Krita responsive, the export runs on the GUI thread
+        QApplication.processEvents()
+        if self.progressDialog.wasCanceled():
+            raise SpineExport.ExportCancelled()
+
     def _selectDir(self):
         doc = self._selectedDocuments()
         if doc[0]:
@@ -146,11 +431,26 @@ class UIDocumentTools(object):
 
     def _documentSelected(self):
         doc = self._selectedDocuments()
+        if not doc:
+            return
         self.directoryTextField.setText(os.path.dirname(doc[0].fileName()))
-        # TODO have this loop through the tabs and set them up
-        widget = self.tabTools.currentWidget()
-        # Tell the widget to update itself to the current settings
-        widget.updateFields(doc[0])
+        if self.watcher:
+            self.watchCheckBox.setChecked(self.watcher.isWatching(doc[0]))
+        self._loadPngSettings(doc[0])
+        # Tool tabs hold the sizes of one document and are not used for several
+        self.tabTools.setEnabled(len(doc) == 1)
+        # Tell the tools to update themselves to the current settings
+        for tool in self._tools():
+            if hasattr(tool, 'updateFields'):
+                tool.updateFields(doc[0])
+
+    def _toolSettings(self):
+        # (tool, current settings) of the built tools, in the order they are applied
+        return [(tool, tool.settings()) for tool in self._tools()]
+
+    def _tools(self):
+        # Tools in the order they are applied, tabs never shown keep the document unchanged
+        return [entry['tool'] for entry in self.toolEntries if entry['tool'] is not None]
 
 
     def _selectedDocuments(self):
@@ -0,0 +1,102 @@
+import random
+
+import pytest
+
+from KritaToSpine import atlaspacker
+from KritaToSpine import layernodes
+from KritaToSpine.SpineExport import SpineExport
+
+
+def rectangles(seed, count, largest):
+    generator = random.Random(seed)
+    return [('image{0}'.format(index), generator.randint(1, largest), generator.randint(1, largest))
+            for index in range(count)]
+
+
+def placed(region, padding):
+    # Area the region takes on its page, with the padding on its right and bottom
+    width, height = (region.height, region.width) if region.rotated else (region.width, region.height)
+    return region.x, region.y, width + padding, height + padding
+
+
+def overlaps(first, second):
+    horizontal = first[0] < second[0] + second[2] and second[0] < first[0] + first[2]
+    vertical = first[1] < second[1] + second[3] and second[1] < first[1] + first[3]
+    return horizontal and vertical
+
+
+@pytest.mark.parametrize('seed, count, largest, allowRotation', [
+    (1, 200, 60, False),
+    (2, 200, 60, True),
+    (3, 60, 500, False),
+    (4, 300, 250, True),
+])
+def test_regions_do_not_overlap_and_stay_on_the_page(seed, count, largest, allowRotation):
+    images = rectangles(seed, count, largest)
+    packer = atlaspacker.AtlasPacker(1024, 1024, allowRotation=allowRotation)
+    pages = packer.pack(images)
+
+    sizes = dict((name, (width, height)) for name, width, height in images)
+    assert sorted(region.name for page in pages for region in page.regions) == sorted(sizes)
+    for page in pages:
+        assert page.width <= 1024 and page.height <= 1024
+        assert page.width & (page.width - 1) == 0 and page.height & (page.height - 1) == 0
+        rects = [placed(region, packer.padding) for region in page.regions]
+        for region, (x, y, width, height) in zip(page.regions, rects):
+            assert (region.width, region.height) == sizes[region.name]
+            assert x >= packer.padding and y >= packer.padding
+            assert x + width <= page.width and y + height <= page.height
+        for index, rect in enumerate(rects):
+            assert not any(overlaps(rect, other) for other in rects[index + 1:])
+
+
+def test_largest_image_that_fits():
+    packer = atlaspacker.AtlasPacker(256, 256, padding=2)
+    assert packer.fits(252, 252) and not packer.fits(253, 10)
+    pages = packer.pack([('full', 252, 252), ('small', 4, 4)])
+    assert [(page.width, page.height) for page in pages] == [(256, 256), (8, 8)]
+    with pytest.raises(ValueError):
+        packer.pack([('wide', 253, 10)])
+
+
+def layer(name, x, y, width, height, color):
+    return layernodes.FakeNode(name, bounds=(x, y, width, height), pixels=bytes(color) * (width * height))
+
+
+def export(document, directory, maxSize=2048):
+    exporter = SpineExport()
+    exporter.headless = True
+    exporter.atlasPacker = atlaspacker.AtlasPacker(maxSize, maxSize)
+    exporter.exportDocument(layernodes.FakeDocument(document), str(directory))
+    return exporter
+
+
+class GrayNode(layernodes.FakeNode):
+
+    def colorModel(self):
+        return 'GRAYA'
+
+
+def test_oversized_layer_is_reported(tmp_path):
+    document = layernodes.FakeNode('root', [layer('sky', 0, 0, 130, 20, (255, 0, 0, 255))])
+    with pytest.raises(RuntimeError, match='sky'):
+        export(document, tmp_path, 128)
+    assert not (tmp_path / 'spine.atlas').exists()
+
+
+def test_other_color_spaces_are_reported(tmp_path):
+    document = layernodes.FakeNode('root', [GrayNode('shadow', bounds=(0, 0, 4, 4), pixels=bytes(64))])
+    with pytest.raises(RuntimeError, match='shadow'):
+        export(document, tmp_path)
+
+
+def test_empty_layers_get_no_attachment(tmp_path):
+    document = layernodes.FakeNode('root', [
+        layer('body', 10, 10, 8, 8, (0, 0, 255, 255)),
+        layernodes.FakeNode('empty', bounds=(0, 0, 0, 0)),
+    ])
+    skeleton = export(document, tmp_path).json
+    assert list(skeleton['skins']['default']) == ['body']
+    with open(str(tmp_path / 'spine.atlas')) as infile:
+        atlas = infile.read()
+    assert '\nbody\n' in atlas and 'empty' not in atlas
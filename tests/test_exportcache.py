@@ -0,0 +1,82 @@
+import json
+
+from KritaToSpine import exportcache
+from KritaToSpine import layernodes
+from KritaToSpine.SpineExport import SpineExport
+
+
+def layer(name, x, y, width, height, color):
+    return layernodes.FakeNode(name, bounds=(x, y, width, height), pixels=bytes(color) * (width * height))
+
+
+def export(document, directory, **settings):
+    exporter = SpineExport()
+    exporter.headless = True
+    for key, value in settings.items():
+        setattr(exporter, key, value)
+    assert exporter.exportDocument(layernodes.FakeDocument(document), str(directory))
+    return exporter
+
+
+def document(armColor=(0, 0, 255, 255), leg=True):
+    layers = [layer('arm', 10, 10, 8, 8, armColor), layer('head', 30, 10, 6, 6, (0, 255, 0, 255))]
+    if leg:
+        layers.append(layer('leg', 50, 10, 4, 12, (255, 0, 0, 255)))
+    return layernodes.FakeNode('root', layers)
+
+
+def mark(path):
+    # Replaces an image so a skipped layer can be told from a rewritten one
+    path.write_bytes(b'kept')
+
+
+def manifest(directory):
+    with open(str(directory / exportcache.ExportCache.manifestName)) as infile:
+        return json.load(infile)['layers']
+
+
+def test_unchanged_layers_are_skipped(tmp_path):
+    export(document(), tmp_path)
+    for name in ('arm', 'head', 'leg'):
+        mark(tmp_path / '{0}.png'.format(name))
+
+    exporter = export(document(armColor=(0, 0, 200, 255)), tmp_path)
+    assert exporter.tiers[0].cache.skipped == 2
+    assert (tmp_path / 'arm.png').read_bytes() != b'kept'
+    assert (tmp_path / 'head.png').read_bytes() == b'kept'
+
+    # Other export settings invalidate every entry
+    exporter = export(document(armColor=(0, 0, 200, 255)), tmp_path, pixelFormat='rgba4444')
+    assert exporter.tiers[0].cache.skipped == 0
+    assert (tmp_path / 'head.png').read_bytes() != b'kept'
+
+
+def test_missing_files_are_written_again(tmp_path):
+    export(document(), tmp_path)
+    (tmp_path / 'head.png').unlink()
+    exporter = export(document(), tmp_path)
+    assert exporter.tiers[0].cache.skipped == 2
+    assert (tmp_path / 'head.png').exists()
+
+
+def test_stale_images_are_removed(tmp_path):
+    export(document(), tmp_path)
+    export(document(leg=False), tmp_path)
+    assert sorted(path.name for path in tmp_path.glob('*.png')) == ['arm.png', 'head.png']
+    assert sorted(manifest(tmp_path)) == ['arm.png', 'head.png']
+
+
+def test_partial_export_keeps_unvisited_entries(tmp_path):
+    export(document(), tmp_path)
+    export(document(armColor=(0, 0, 200, 255), leg=False), tmp_path, partial=['arm'])
+    # The leg was not visited, its image and cache entry stay
+    assert sorted(path.name for path in tmp_path.glob('*.png')) == ['arm.png', 'head.png', 'leg.png']
+    assert sorted(manifest(tmp_path)) == ['arm.png', 'head.png', 'leg.png']
+
+
+def test_full_export_drops_unvisited_entries(tmp_path):
+    export(document(), tmp_path)
+    cache = exportcache.ExportCache(str(tmp_path), {'scale': 1})
+    cache.isCurrent('arm.png', 'digest', (0, 0, 1, 1))
+    cache.save()
+    assert sorted(manifest(tmp_path)) == ['arm.png']
@@ -0,0 +1,45 @@
+import json
+
+from KritaToSpine import layernodes
+from KritaToSpine import spinejson
+from KritaToSpine.SpineExport import SpineExport
+
+
+def layer(name, x, y, width, height, color):
+    return layernodes.FakeNode(name, bounds=(x, y, width, height), pixels=bytes(color) * (width * height))
+
+
+def export(document, directory, **settings):
+    exporter = SpineExport()
+    exporter.headless = True
+    for key, value in settings.items():
+        setattr(exporter, key, value)
+    assert exporter.exportDocument(layernodes.FakeDocument(document), str(directory))
+    return exporter
+
+
+def eyes(color):
+    return layernodes.FakeNode('root', [
+        layernodes.FakeNode('a (slot)', [layer('eye', 10, 10, 8, 8, (0, 0, 255, 255))]),
+        layernodes.FakeNode('b (slot)', [layer('eye', 40, 10, 8, 8, color)]),
+    ])
+
+
+def read(path):
+    with open(str(path), 'rb') as infile:
+        return infile.read()
+
+
+def test_partial_export_keeps_image_names(tmp_path):
+    export(eyes((0, 255, 0, 255)), tmp_path)
+    first = read(tmp_path / 'eye.png')
+    second = read(tmp_path / 'eye_2.png')
+
+    export(eyes((255, 0, 0, 255)), tmp_path, partial=['b'])
+    assert read(tmp_path / 'eye.png') == first
+    assert read(tmp_path / 'eye_2.png') != second
+    assert sorted(path.name for path in tmp_path.glob('*.png')) == ['eye.png', 'eye_2.png']
+    with open(str(tmp_path / 'spine.json')) as infile:
+        skins = spinejson.fromSpine38(json.load(infile))['skins']
+    assert 'path' not in skins['default']['a']['eye']
+    assert skins['default']['b']['eye']['path'] == 'eye_2'
@@ -0,0 +1,105 @@
+import struct
+import zlib
+
+from KritaToSpine import pngwriter
+
+
+def decode(png):
+    # (color type, palette size, RGBA pixels) of a PNG written by pngwriter
+    chunks = {}
+    position = 8
+    while position < len(png):
+        length, = struct.unpack('>I', png[position:position + 4])
+        tag = png[position + 4:position + 8]
+        chunks[tag] = chunks.get(tag, b'') + png[position + 8:position + 8 + length]
+        position += 12 + length
+    width, height, depth, colorType = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    bpp = 1 if colorType == 3 else 4
+    pixels = unfilter(zlib.decompress(chunks[b'IDAT']), width * bpp, height, bpp)
+    if colorType != 3:
+        return colorType, 0, pixels
+    palette, alpha = chunks[b'PLTE'], chunks[b'tRNS']
+    colors = [palette[index * 3:index * 3 + 3] + alpha[index:index + 1] for index in range(len(alpha))]
+    return colorType, len(colors), b''.join(colors[index] for index in pixels)
+
+
+def unfilter(raw, stride, height, bpp, prior=None):
+    pixels = bytearray()
+    prior = prior or bytearray(stride)
+    for y in range(height):
+        filterType = raw[y * (stride + 1)]
+        row = bytearray(raw[y * (stride + 1) + 1:(y + 1) * (stride + 1)])
+        for index in range(stride):
+            left = row[index - bpp] if index >= bpp else 0
+            up = prior[index]
+            upLeft = prior[index - bpp] if index >= bpp else 0
+            estimate = left + up - upLeft
+            paeth = min((abs(estimate - left), 0, left), (abs(estimate - up), 1, up),
+                        (abs(estimate - upLeft), 2, upLeft))[2]
+            predictor = (0, left, up, (left + up) // 2, paeth)[filterType]
+            row[index] = (row[index] + predictor) & 0xff
+        pixels += row
+        prior = row
+    return bytes(pixels)
+
+
+def gradient(width, height):
+    # BGRA with far more than 256 colors and a transparent left edge
+    data = bytearray()
+    for y in range(height):
+        for x in range(width):
+            alpha = 0 if x < 10 else min(255, (x - 10) * 8)
+            data += bytes((x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height), alpha))
+    return bytes(data)
+
+
+def test_indexed_quantises_many_colors():
+    width, height = 120, 80
+    data = gradient(width, height)
+    colorType, colors, pixels = decode(pngwriter.encodePng(data, width, height, pixelFormat='indexed'))
+    assert colorType == 3 and colors <= 256
+    rgba = pngwriter.bgraToRgba(data)
+    visible = [index for index in range(len(rgba)) if rgba[index - index % 4 + 3]]
+    assert sum(abs(pixels[index] - rgba[index]) for index in visible) / len(visible) < 4
+    assert all(pixels[(y * width + x) * 4 + 3] == 0 for y in range(height) for x in range(10))
+
+
+def test_indexed_keeps_few_colors():
+    data = b''.join(bytes((index % 7 * 30, 5, 9, 255)) for index in range(64 * 16))
+    colorType, colors, pixels = decode(pngwriter.encodePng(data, 64, 16, pixelFormat='indexed'))
+    assert colorType == 3 and colors == 7
+    assert pixels == pngwriter.bgraToRgba(data)
+
+
+def test_filters_round_trip():
+    width, height = 40, 30
+    rgba = pngwriter.bgraToRgba(gradient(width, height))
+    for types in ([(0,)], [(1,)], [(2,)], [(3,)], [(4,)], pngwriter.filterTypes(9)):
+        raw = pngwriter._scanlines(rgba, width * 4, height, 4, None, types)
+        assert unfilter(raw, width * 4, height, 4) == rgba, types
+    # The first row of a strip refers to the last row of the previous strip
+    prior = bytes(index * 7 % 256 for index in range(width * 4))
+    for types in ([(2,)], [(3,)], [(4,)]):
+        raw = pngwriter._scanlines(rgba, width * 4, height, 4, prior, types)
+        assert unfilter(raw, width * 4, height, 4, prior) == rgba, types
+
+
+def test_strips_match_whole_image(tmp_path):
+    width, height, rows = 90, 70, 12
+    data = gradient(width, height)
+    strips = [(data[y * width * 4:(y + rows) * width * 4], min(rows, height - y)) for y in range(0, height, rows)]
+    for pixelFormat, dither in (('indexed', False), ('rgba4444', True)):
+        palette = None
+        if pixelFormat == 'indexed':
+            palette = pngwriter.Palette()
+            for strip, stripHeight in strips:
+                palette.add(pngwriter.convert(strip, width, stripHeight, pixelFormat))
+            palette.finish()
+        fileName = str(tmp_path / 'strips.png')
+        stream = pngwriter.PngStream(fileName, width, height, 6, pixelFormat, False, palette, dither)
+        for strip, stripHeight in strips:
+            stream.write(strip, stripHeight)
+        stream.close()
+        with open(fileName, 'rb') as infile:
+            assert decode(infile.read()) == decode(
+                pngwriter.encodePng(data, width, height, 6, pixelFormat, False, dither)), pixelFormat
@@ -0,0 +1,79 @@
+from KritaToSpine import layernodes
+from KritaToSpine import skeletondiff
+from KritaToSpine.SpineExport import SpineExport
+
+
+def skeleton(bones, slots, skins):
+    return {
+        'bones': [dict(name=name, **values) for name, values in bones],
+        'slots': [{'name': name, 'bone': bone, 'attachment': name} for name, bone in slots],
+        'skins': skins,
+    }
+
+
+def attachment(x, y, width=10, height=10):
+    return {'x': x, 'y': y, 'rotation': 0, 'width': width, 'height': height}
+
+
+def previous():
+    return skeleton(
+        [('root', {}), ('arm', {'parent': 'root', 'x': 5, 'y': 5}), ('leg', {'parent': 'root', 'x': 0, 'y': -5})],
+        [('hand', 'arm'), ('foot', 'leg')],
+        {'default': {'hand': {'hand': attachment(1, 2)}, 'foot': {'foot': attachment(3, 4)}}})
+
+
+def test_added_removed_and_moved_entries():
+    current = skeleton(
+        [('root', {}), ('arm', {'parent': 'root', 'x': 6.5, 'y': 5}), ('head', {'parent': 'root', 'x': 0, 'y': 20})],
+        [('hand', 'arm'), ('hat', 'head')],
+        {'default': {'hand': {'hand': attachment(1, 2, 12)}, 'hat': {'hat': attachment(0, 0)}}})
+    report = skeletondiff.diffSkeletons(previous(), current)
+
+    assert report['bones']['added'] == ['head'] and report['bones']['removed'] == ['leg']
+    assert report['bones']['moved'] == [{'name': 'arm', 'from': {'x': 5}, 'to': {'x': 6.5}}]
+    assert report['slots']['added'] == ['hat'] and report['slots']['removed'] == ['foot']
+    assert report['slots']['moved'] == []
+    assert report['attachments']['added'] == ['default/hat/hat']
+    assert report['attachments']['removed'] == ['default/foot/foot']
+    assert report['attachments']['moved'] == [{'name': 'default/hand/hand', 'from': {'width': 10}, 'to': {'width': 12}}]
+    assert report['warnings'] == []
+    assert skeletondiff.counts(report) == {'bones': (1, 1, 1), 'slots': (1, 1, 0), 'attachments': (1, 1, 1)}
+
+
+def test_first_export_and_rounded_floats():
+    report = skeletondiff.diffSkeletons(None, previous())
+    assert skeletondiff.counts(report) == {'bones': (3, 0, 0), 'slots': (2, 0, 0), 'attachments': (2, 0, 0)}
+
+    current = previous()
+    current['bones'][1]['x'] = 5.004
+    assert skeletondiff.diffSkeletons(previous(), current)['bones']['moved']
+    assert not skeletondiff.diffSkeletons(previous(), current, 0.01)['bones']['moved']
+
+
+def test_duplicate_and_orphan_warnings():
+    current = skeleton(
+        [('root', {}), ('arm', {'parent': 'body'}), ('body', {'parent': 'root'}), ('arm', {'parent': 'root'})],
+        [('hand', 'arm'), ('hand', 'arm'), ('tail', 'tail')],
+        {'default': {'hand': {'hand': attachment(0, 0)}}, 'red': {'wing': {'wing': attachment(0, 0)}}})
+    warnings = [(warning['type'], warning['name']) for warning in skeletondiff.diffSkeletons(None, current)['warnings']]
+    assert warnings == [
+        ('duplicateBone', 'arm'),
+        ('duplicateSlot', 'hand'),
+        ('orphanBone', 'arm'),
+        ('orphanSlot', 'tail'),
+        ('orphanAttachments', 'red/wing'),
+    ]
+
+
+def test_duplicate_layer_names_are_reported(tmp_path):
+    # Two layers of the same name in one skin can not share a slot
+    document = layernodes.FakeNode('root', [
+        layernodes.FakeNode('eye', bounds=(10, 10, 4, 4), pixels=bytes((0, 0, 255, 255)) * 16),
+        layernodes.FakeNode('eye', bounds=(30, 10, 4, 4), pixels=bytes((0, 255, 0, 255)) * 16),
+    ])
+    exporter = SpineExport()
+    exporter.headless = True
+    assert exporter.exportDocument(layernodes.FakeDocument(document), str(tmp_path))
+    assert [slot['name'] for slot in exporter.json['slots']] == ['eye', 'eye']
+    report = skeletondiff.diffSkeletons(None, exporter.json)
+    assert [(warning['type'], warning['name']) for warning in report['warnings']] == [('duplicateSlot', 'eye')]
@@ -0,0 +1,61 @@
+import json
+
+from KritaToSpine import layernodes
+from KritaToSpine.SpineExport import SpineExport
+
+
+def layer(name, x, y, width, height, color):
+    return layernodes.FakeNode(name, bounds=(x, y, width, height), pixels=bytes(color) * (width * height))
+
+
+def export(document, directory, **settings):
+    exporter = SpineExport()
+    exporter.headless = True
+    for key, value in settings.items():
+        setattr(exporter, key, value)
+    assert exporter.exportDocument(layernodes.FakeDocument(document), str(directory))
+    return exporter
+
+
+def readJson(path):
+    with open(str(path)) as infile:
+        return json.load(infile)
+
+
+def test_skins_share_the_default_slot(tmp_path):
+    skeleton = export(layernodes.FakeNode('root', [
+        layer('hat', 15, 5, 21, 9, (10, 20, 30, 255)),
+        layernodes.FakeNode('red (skin)', [layer('hat', 14, 4, 23, 11, (0, 0, 200, 255))]),
+        layernodes.FakeNode('blue (skin)', [layer('hat', 15, 5, 21, 9, (10, 20, 30, 255))]),
+    ]), tmp_path).json
+    assert [slot['name'] for slot in skeleton['slots']] == ['hat']
+    for skin in ('default', 'red', 'blue'):
+        assert 'hat' in skeleton['skins'][skin]['hat']
+
+
+def test_same_layer_name_under_different_bones(tmp_path):
+    exporter = export(layernodes.FakeNode('root', [
+        layernodes.FakeNode('head (bone)', [layer('eye', 10, 10, 8, 8, (0, 0, 255, 255))]),
+        layernodes.FakeNode('tail (bone)', [layer('eye', 60, 40, 6, 6, (0, 255, 0, 255))]),
+    ]), tmp_path)
+    slots = [(slot['name'], slot['bone']) for slot in exporter.json['slots']]
+    assert slots == [('eye', 'head'), ('eye', 'tail')]
+    report = readJson(tmp_path / 'spine.diff.json')
+    assert [(warning['type'], warning['name']) for warning in report['warnings']] == [('duplicateSlot', 'eye')]
+    assert exporter.stats['warnings']
+
+
+def test_json_layout_follows_the_output_format(tmp_path):
+    document = layernodes.FakeNode('root', [
+        layer('body', 10, 10, 8, 8, (0, 0, 255, 255)),
+        layernodes.FakeNode('red (skin)', [layer('body', 10, 10, 8, 8, (255, 0, 0, 255))]),
+    ])
+    export(document, tmp_path / 'json')
+    skeleton = readJson(tmp_path / 'json' / 'spine.json')
+    assert 'spine' not in skeleton['skeleton']
+    assert sorted(skeleton['skins']) == ['default', 'red']
+
+    export(document, tmp_path / 'both', outputFormat='both')
+    skeleton = readJson(tmp_path / 'both' / 'spine.json')
+    assert skeleton['skeleton']['spine'] == '3.8.99'
+    assert [skin['name'] for skin in skeleton['skins']] == ['default', 'red']
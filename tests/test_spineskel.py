@@ -0,0 +1,82 @@
+import struct
+
+from KritaToSpine import benchmark
+from KritaToSpine import layernodes
+from KritaToSpine.SpineExport import SpineExport
+from KritaToSpine.spineskel import encodeSkeleton, readSkeleton
+
+
+def float32(value):
+    return struct.unpack('<f', struct.pack('<f', value))[0]
+
+
+def assertSameModel(decoded, expected, path='skeleton'):
+    # Floats went through the 32 bit floats of the binary format
+    if isinstance(expected, float) or isinstance(decoded, float):
+        assert decoded == float32(expected), path
+    elif isinstance(expected, dict):
+        assert sorted(decoded) == sorted(expected), path
+        for key in expected:
+            assertSameModel(decoded[key], expected[key], '{0}.{1}'.format(path, key))
+    elif isinstance(expected, list):
+        assert len(decoded) == len(expected), path
+        for index, (decodedItem, expectedItem) in enumerate(zip(decoded, expected)):
+            assertSameModel(decodedItem, expectedItem, '{0}[{1}]'.format(path, index))
+    else:
+        assert decoded == expected, path
+
+
+def pixels(width, height, color):
+    return bytes(color) * (width * height)
+
+
+def skinnedDocument():
+    def layer(name, x, y, width, height, color):
+        return layernodes.FakeNode(name, bounds=(x, y, width, height), pixels=pixels(width, height, color))
+
+    return layernodes.FakeDocument(layernodes.FakeNode('root', [
+        layernodes.FakeNode('body (bone)', [
+            layer('torso', 10, 20, 31, 40, (0, 0, 255, 255)),
+            layernodes.FakeNode('arm (slot)', [
+                layer('upper', 40, 25, 7, 13, (0, 255, 0, 255)),
+                layer('lower', 42, 37, 5, 11, (255, 0, 0, 128)),
+            ]),
+        ]),
+        layer('hat', 15, 5, 21, 9, (10, 20, 30, 255)),
+        layernodes.FakeNode('red (skin)', [
+            layer('hat', 14, 4, 23, 11, (0, 0, 200, 255)),
+        ]),
+        layernodes.FakeNode('blue (skin)', [
+            layer('hat', 15, 5, 21, 9, (10, 20, 30, 255)),
+        ]),
+    ]))
+
+
+def exportModel(document, directory):
+    exporter = SpineExport()
+    exporter.headless = True
+    exporter.useCache = False
+    exporter.outputFormat = 'skel'
+    exporter.exportDocument(document, str(directory))
+    return exporter.json
+
+
+def test_round_trip_skins(tmp_path):
+    skeleton = exportModel(skinnedDocument(), tmp_path)
+    assert sorted(skeleton['skins']) == ['blue', 'default', 'red']
+    assertSameModel(readSkeleton(encodeSkeleton(skeleton)), skeleton)
+
+
+def test_round_trip_generated_document(tmp_path):
+    document, count = benchmark.generateDocument(120, seed=7)
+    skeleton = exportModel(document, tmp_path)
+    assertSameModel(readSkeleton(encodeSkeleton(skeleton)), skeleton)
+
+
+def test_written_skel_matches_json(tmp_path):
+    exporter = SpineExport()
+    exporter.headless = True
+    exporter.outputFormat = 'both'
+    exporter.exportDocument(skinnedDocument(), str(tmp_path))
+    with open(str(tmp_path / 'spine.skel'), 'rb') as infile:
+        assertSameModel(readSkeleton(infile.read()), exporter.json)